@@ -0,0 +1,98 @@
+import argparse
+import glob
+import json
+import os
+import re
+import time
+
+EXPERIMENT_DIR = os.path.dirname(os.path.realpath(__file__))
+
+# add parent dir to path to allow importing from server dir
+parent_dir = os.path.dirname(os.path.dirname(EXPERIMENT_DIR))
+os.sys.path.insert(0, os.path.join(parent_dir, "server"))
+from lib.postprocess import parse_template, postprocess_edit_mode
+
+# number of times to run the local parser when timing it
+LOCAL_RUNS = 1000
+
+
+def code_blocks(markdown: str):
+    return re.findall(r"```(?:json)?\n(.*?)```", markdown, re.DOTALL)
+
+
+# convert outputs using the `{"answer", "is_correct"}` schema to `{"correct", "incorrect"}`
+def normalize_question(question):
+    if "answers" not in question:
+        return question
+
+    return {
+        "question": question["question"],
+        "correct": next(answer["answer"] for answer in question["answers"] if answer["is_correct"]),
+        "incorrect": [answer["answer"] for answer in question["answers"] if not answer["is_correct"]],
+    }
+
+
+def load_sample(path):
+    with open(path) as f:
+        sample = f.read()
+
+    _, _, after_input = sample.partition("# Input")
+    completion = code_blocks(after_input)[0]
+
+    # use the first output from the Edit API as the expected result
+    _, _, after_output = sample.partition("# Output")
+    expected = json.loads(code_blocks(after_output)[0])
+
+    return completion, list(map(normalize_question, expected))
+
+
+def same_question(parsed, expected):
+    return parsed["question"] == expected["question"] \
+        and parsed["correct"] == expected["correct"] \
+        and sorted(parsed["incorrect"]) == sorted(expected["incorrect"])
+
+
+def benchmark_local(completion, expected):
+    start = time.perf_counter()
+    for _ in range(LOCAL_RUNS):
+        parsed = parse_template(completion)
+    elapsed = (time.perf_counter() - start) / LOCAL_RUNS
+
+    correct = sum(any(same_question(p, e) for p in parsed) for e in expected)
+    return correct, elapsed
+
+
+def benchmark_edit(completion, expected):
+    start = time.perf_counter()
+    parsed = postprocess_edit_mode(completion)
+    elapsed = time.perf_counter() - start
+
+    correct = sum(any(same_question(p, e) for p in parsed) for e in expected)
+    return correct, elapsed
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare local template parsing with the Edit API")
+    parser.add_argument("--edit", action="store_true", help="also time the Edit API (requires OPENAI_SECRET_KEY)")
+    args = parser.parse_args()
+
+    total_questions = 0
+    total_local = 0
+    total_edit = 0
+
+    for path in sorted(glob.glob(os.path.join(EXPERIMENT_DIR, "*.md"))):
+        completion, expected = load_sample(path)
+        total_questions += len(expected)
+
+        correct, elapsed = benchmark_local(completion, expected)
+        total_local += correct
+        print(f"{os.path.basename(path)}: local {correct}/{len(expected)} questions in {elapsed * 1000:.3f}ms")
+
+        if args.edit:
+            correct, elapsed = benchmark_edit(completion, expected)
+            total_edit += correct
+            print(f"{os.path.basename(path)}: edit  {correct}/{len(expected)} questions in {elapsed * 1000:.0f}ms")
+
+    print(f"local accuracy: {total_local}/{total_questions}")
+    if args.edit:
+        print(f"edit accuracy: {total_edit}/{total_questions}")
@@ -0,0 +1,107 @@
+"""
+Compares the original Markdown parser, which rendered the AST to JSON and
+cleaned html with BeautifulSoup at every level of the tree, with the
+single-pass parser in server/lib/parsers/md.py. Checks both produce the
+same components for every chapter, then reports parse times.
+
+    python benchmark.py
+    python benchmark.py --runs 20 ../plai/smol.md
+"""
+
+import argparse
+import glob
+import json
+import os
+import re
+import time
+import warnings
+import mistletoe
+from mistletoe.ast_renderer import ASTRenderer
+from bs4 import BeautifulSoup, MarkupResemblesLocatorWarning
+
+EXPERIMENT_DIR = os.path.dirname(os.path.realpath(__file__))
+
+# add parent dir to path to allow importing from server dir
+parent_dir = os.path.dirname(os.path.dirname(EXPERIMENT_DIR))
+os.sys.path.insert(0, os.path.join(parent_dir, "server"))
+from lib.consts import TOP_LEVEL_COMPONENTS
+from lib.parsers.md import md_parser, resolve_include
+from lib.parsers.tokens import tokenize_components
+
+# short components look like urls to BeautifulSoup
+warnings.filterwarnings("ignore", category=MarkupResemblesLocatorWarning)
+
+# number of times to parse each chapter when timing it
+RUNS = 10
+
+
+# original parser, kept here for comparison
+def original_find_component_text(component):
+    text = []
+
+    for child in component["children"]:
+        if child["type"] == "RawText":
+            text.append(re.sub(r'{{(.*?)}}', resolve_include, child["content"]))
+
+        elif child["type"] == "LineBreak":
+            text.append(" ")
+
+        elif "children" in child:
+            text.append(original_find_component_text(child))
+
+    if component["type"] in TOP_LEVEL_COMPONENTS:
+        text.append("\n")
+
+    return BeautifulSoup("".join(text), "lxml").text
+
+
+def original_md_parser(chapter):
+    parsed = json.loads(mistletoe.markdown(chapter, ASTRenderer))
+    valid_children = filter(lambda c: c["type"] in TOP_LEVEL_COMPONENTS, parsed["children"])
+    children_info = tokenize_components(list(map(original_find_component_text, valid_children)))
+
+    return list(filter(lambda c: c["tokens"] > 0, children_info))
+
+
+def time_parser(parser, chapter, runs):
+    start = time.perf_counter()
+    for _ in range(runs):
+        parser(chapter)
+
+    return (time.perf_counter() - start) / runs
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the Markdown parser")
+    parser.add_argument("files", nargs="*", help="chapters to parse, defaults to experiments/plai")
+    parser.add_argument("--runs", type=int, default=RUNS, help="times to parse each chapter")
+    args = parser.parse_args()
+
+    files = args.files or sorted(glob.glob(os.path.join(parent_dir, "experiments/plai/*.md")))
+    total_original = total_single_pass = 0
+    mismatches = 0
+
+    print(f"{'chapter':<36} {'components':>10} {'original':>10} {'single pass':>12} {'speedup':>8}")
+
+    for path in files:
+        with open(path) as f:
+            chapter = f.read()
+
+        expected = original_md_parser(chapter)
+        components = md_parser(chapter)
+
+        if components != expected:
+            mismatches += 1
+            print(f"{os.path.basename(path)}: components differ from the original parser")
+
+        original = time_parser(original_md_parser, chapter, args.runs)
+        single_pass = time_parser(md_parser, chapter, args.runs)
+        total_original += original
+        total_single_pass += single_pass
+
+        print(f"{os.path.basename(path):<36} {len(components):>10} {original * 1000:>8.1f}ms "
+              f"{single_pass * 1000:>10.1f}ms {original / single_pass:>7.1f}x")
+
+    print(f"\n{'total':<36} {'':>10} {total_original * 1000:>8.1f}ms "
+          f"{total_single_pass * 1000:>10.1f}ms {total_original / total_single_pass:>7.1f}x")
+    print(f"{mismatches} of {len(files)} chapters differ")
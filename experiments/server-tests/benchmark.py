@@ -0,0 +1,270 @@
+"""
+End-to-end load benchmark against a local server backed by fake_openai.py.
+
+For each gunicorn worker count, starts a fresh server and job workers with a
+temporary database, then simulates users who upload content, wait for the
+generated questions, fetch the generation, ask for more questions, and
+stream questions. Reports throughput and p50/p95/p99 latency per endpoint.
+
+    python benchmark.py --workers 1,2,4 --users 20
+    python benchmark.py --workers 4 -- --latency constant:1 --rate-limit 0.1
+    python benchmark.py --workers 4 --executors threads,gevent
+
+Arguments after `--` are passed to fake_openai.py.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import pathlib
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from collections import defaultdict
+import aiohttp
+
+EXPERIMENT_DIR = pathlib.Path(__file__).parent.resolve()
+SERVER_DIR = EXPERIMENT_DIR.parent.parent.joinpath("server")
+GUNICORN_CONFIG = EXPERIMENT_DIR.joinpath("gunicorn_benchmark.py")
+CONTENT_FILE = EXPERIMENT_DIR.parent.joinpath("plai/smol-reactivity.md")
+
+# job statuses from `JobStatus` in server/lib/consts.py
+JOB_COMPLETE = 2
+JOB_FAILED = 3
+
+# seconds to wait for a job before counting it as failed
+JOB_TIMEOUT = 300
+
+# seconds between job status checks, matching the frontend
+JOB_POLL_INTERVAL = 2
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def percentile(values, p):
+    if not values:
+        return None
+
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))]
+
+
+class Recorder:
+    def __init__(self):
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+
+    def record(self, endpoint, seconds, ok):
+        if ok:
+            self.latencies[endpoint].append(seconds)
+        else:
+            self.errors[endpoint] += 1
+
+    def report(self, elapsed):
+        rows = []
+
+        for endpoint in sorted(set(self.latencies) | set(self.errors)):
+            latencies = self.latencies[endpoint]
+            rows.append({
+                "endpoint": endpoint,
+                "requests": len(latencies) + self.errors[endpoint],
+                "errors": self.errors[endpoint],
+                "throughput": len(latencies) / elapsed,
+                "p50": percentile(latencies, 50),
+                "p95": percentile(latencies, 95),
+                "p99": percentile(latencies, 99),
+            })
+
+        return rows
+
+
+async def timed(recorder: Recorder, endpoint: str, request):
+    start = time.perf_counter()
+
+    try:
+        async with request as response:
+            body = await response.read()
+            ok = response.status < 400
+    except aiohttp.ClientError:
+        body, ok = b"", False
+
+    recorder.record(endpoint, time.perf_counter() - start, ok)
+    return json.loads(body) if ok and body.startswith(b"{") else None
+
+
+async def wait_for_job(session, url, recorder: Recorder, endpoint: str, job_id: int):
+    start = time.perf_counter()
+
+    while time.perf_counter() - start < JOB_TIMEOUT:
+        async with session.get(f"{url}/api/jobs/{job_id}") as response:
+            job = await response.json()
+
+        if job["status"] in (JOB_COMPLETE, JOB_FAILED):
+            recorder.record(endpoint, time.perf_counter() - start, job["status"] == JOB_COMPLETE)
+            return
+
+        await asyncio.sleep(JOB_POLL_INTERVAL)
+
+    recorder.record(endpoint, time.perf_counter() - start, False)
+
+
+async def simulate_user(url, recorder: Recorder, args, content):
+    # each user has its own session cookie, like separate browsers
+    async with aiohttp.ClientSession(cookie_jar=aiohttp.CookieJar(unsafe=True)) as session:
+        await session.post(f"{url}/auth/authenticate")
+
+        upload = {
+            "title": "Test quiz",
+            "content": content,
+            "content_type": "Markdown",
+            "count": args.questions,
+            "cache": args.cache,
+        }
+        queued = await timed(recorder, "POST /api/upload", session.post(f"{url}/api/upload", json=upload))
+        if not queued:
+            return
+
+        generation_url = f"{url}/api/generated/{queued['generation_id']}"
+        await wait_for_job(session, url, recorder, "upload job", queued["job_id"])
+        await timed(recorder, "GET /api/generated/<id>", session.get(generation_url))
+
+        queued = await timed(recorder, "POST /api/generated/<id>/more",
+                             session.post(f"{generation_url}/more", json={ "count": args.more }))
+        if queued:
+            await wait_for_job(session, url, recorder, "more job", queued["job_id"])
+
+        await timed(recorder, "GET /api/generated/<id>/stream",
+                    session.get(f"{generation_url}/stream", params={ "count": args.more }))
+
+
+async def run_load(url, args, content):
+    recorder = Recorder()
+
+    start = time.perf_counter()
+    await asyncio.gather(*(simulate_user(url, recorder, args, content) for _ in range(args.users)))
+
+    return recorder.report(time.perf_counter() - start)
+
+
+def wait_for_server(url, process, timeout=60):
+    async def ready():
+        async with aiohttp.ClientSession() as session:
+            async with session.get(f"{url}/auth/authenticated") as response:
+                return response.status == 200
+
+    start = time.time()
+    while time.time() - start < timeout:
+        if process.poll() is not None:
+            raise RuntimeError("Server exited during startup")
+
+        try:
+            if asyncio.run(ready()):
+                return
+        except aiohttp.ClientError:
+            pass
+
+        time.sleep(0.5)
+
+    raise RuntimeError("Server didn't start in time")
+
+
+def benchmark_workers(workers, executor, openai_url, args, content):
+    with tempfile.TemporaryDirectory() as directory:
+        port = free_port()
+        url = f"http://127.0.0.1:{port}"
+
+        env = {
+            **os.environ,
+            "ENV": "",
+            "OPENAI_API_BASE": openai_url,
+            "OPENAI_SECRET_KEY": "fake",
+            "QUIZICIST_SQLALCHEMY_DATABASE_URI": args.database or f"sqlite:///{directory}/benchmark.db",
+            "QUIZICIST_RATELIMIT_ENABLED": "false",
+            "QUIZICIST_JOB_QUEUE_URI": args.job_queue,
+            "QUIZICIST_COMPLETION_CACHE_URI": "memory://",
+            "COMPLETION_EXECUTOR": executor,
+        }
+
+        subprocess.run([sys.executable, "create_db.py"], cwd=SERVER_DIR, env=env, check=True)
+
+        server = subprocess.Popen(
+            [sys.executable, "-m", "gunicorn", "-c", str(GUNICORN_CONFIG),
+             "-w", str(workers), "-b", f"127.0.0.1:{port}", "main:app"],
+            cwd=SERVER_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+        )
+        job_workers = [
+            subprocess.Popen([sys.executable, "worker.py"], cwd=SERVER_DIR, env=env,
+                             stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+            for _ in range(args.job_workers)
+        ]
+
+        try:
+            wait_for_server(url, server)
+            return asyncio.run(run_load(url, args, content))
+        finally:
+            for process in [server, *job_workers]:
+                process.terminate()
+                process.wait()
+
+
+def print_report(workers, executor, rows):
+    print(f"\n{workers} gunicorn workers, {executor} executor")
+    print(f"{'endpoint':<32} {'requests':>8} {'errors':>6} {'req/s':>7} {'p50':>7} {'p95':>7} {'p99':>7}")
+
+    for row in rows:
+        latencies = [f"{row[p]:7.3f}" if row[p] is not None else f"{'-':>7}" for p in ("p50", "p95", "p99")]
+        print(f"{row['endpoint']:<32} {row['requests']:>8} {row['errors']:>6} {row['throughput']:>7.2f} {' '.join(latencies)}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the server against a fake OpenAI API")
+    parser.add_argument("--workers", default="1,2,4", help="comma-separated gunicorn worker counts")
+    parser.add_argument("--job-workers", type=int, default=2, help="number of worker.py processes")
+    parser.add_argument("--executors", default="auto", help="comma-separated completion executors (auto, threads, gevent)")
+    parser.add_argument("--users", type=int, default=20, help="concurrent simulated users")
+    parser.add_argument("--questions", type=int, default=5, help="questions per upload")
+    parser.add_argument("--more", type=int, default=2, help="questions per request for more, and per stream")
+    parser.add_argument("--cache", action="store_true", help="allow uploads to use cached completions")
+    parser.add_argument("--database", help="database URI, defaults to a temporary SQLite database")
+    parser.add_argument("--job-queue", default="database://", help="job queue URI")
+    parser.add_argument("--openai-url", help="use a running fake OpenAI API instead of starting one")
+    parser.add_argument("--output", help="also write results as JSON")
+    args, fake_args = parser.parse_known_args()
+
+    with open(CONTENT_FILE) as f:
+        content = f.read()
+
+    fake = None
+    openai_url = args.openai_url
+
+    if openai_url is None:
+        fake_port = free_port()
+        openai_url = f"http://127.0.0.1:{fake_port}/v1"
+
+        fake_args = [arg for arg in fake_args if arg != "--"]
+        fake = subprocess.Popen(
+            [sys.executable, str(EXPERIMENT_DIR.joinpath("fake_openai.py")), "--port", str(fake_port), *fake_args],
+            stdout=subprocess.DEVNULL,
+        )
+
+    results = {}
+
+    try:
+        for workers in map(int, args.workers.split(",")):
+            for executor in args.executors.split(","):
+                results[f"{workers}/{executor}"] = rows = benchmark_workers(workers, executor, openai_url, args, content)
+                print_report(workers, executor, rows)
+    finally:
+        if fake:
+            fake.terminate()
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
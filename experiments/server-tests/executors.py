@@ -0,0 +1,162 @@
+"""
+Compares completion fan-out executors against fake_openai.py: the original
+per-request `multiprocessing.dummy.Pool`, the shared thread pool, greenlets,
+and asyncio. Each executor runs in its own process, since gevent has to
+monkey-patch I/O before anything else is imported.
+
+    python executors.py --generations 50 --shards 6 -- --latency constant:1
+"""
+
+import argparse
+import json
+import os
+import pathlib
+import resource
+import socket
+import subprocess
+import sys
+import time
+
+EXPERIMENT_DIR = pathlib.Path(__file__).parent.resolve()
+SERVER_DIR = EXPERIMENT_DIR.parent.parent.joinpath("server")
+
+EXECUTORS = ["pool", "threads", "gevent", "asyncio"]
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def percentile(values, p):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))]
+
+
+def run_executor(executor, generations, num_shards, num_questions):
+    """
+    Runs `generations` concurrent generations with the executor, returning
+    timings. Called in a child process.
+    """
+
+    if executor == "gevent":
+        from gevent import monkey
+        monkey.patch_all()
+
+    os.sys.path.insert(0, str(SERVER_DIR))
+    import threading
+    from multiprocessing.dummy import Pool
+    from lib import completion
+    from lib.executor import ThreadExecutor, GeventExecutor, completion_executor
+
+    shards = [f"Section {index} of the chapter. " * 200 for index in range(num_shards)]
+    jobs = completion.plan_completion(shards, num_questions, long_document=True)
+
+    # original fan-out, creating a thread pool for every generation
+    def run_jobs_with_pool(shards, jobs, use_cache):
+        run_batch = completion.batch_runner(shards, jobs, use_cache=use_cache)
+        batches = completion.batch_jobs(jobs)
+
+        with Pool(min(len(batches), completion.MAX_CONCURRENT_COMPLETIONS)) as pool:
+            for results in pool.imap_unordered(run_batch, batches):
+                yield from results
+
+    latencies = []
+
+    def generate():
+        start = time.perf_counter()
+
+        if executor == "pool":
+            list(run_jobs_with_pool(shards, jobs, use_cache=False))
+        else:
+            list(completion.run_jobs(shards, jobs, use_cache=False))
+
+        latencies.append(time.perf_counter() - start)
+
+    async def agenerate():
+        start = time.perf_counter()
+        async for _ in completion.arun_jobs(shards, jobs, use_cache=False):
+            pass
+
+        latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+
+    if executor == "asyncio":
+        import asyncio
+
+        async def main():
+            await asyncio.gather(*(agenerate() for _ in range(generations)))
+
+        asyncio.run(main())
+
+    elif executor == "gevent":
+        import gevent
+        completion_executor.executor = GeventExecutor()
+        gevent.joinall([gevent.spawn(generate) for _ in range(generations)])
+
+    else:
+        completion_executor.executor = ThreadExecutor()
+        threads = [threading.Thread(target=generate) for _ in range(generations)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    return {
+        "executor": executor,
+        "seconds": time.perf_counter() - start,
+        "p50": percentile(latencies, 50),
+        "p95": percentile(latencies, 95),
+        "p99": percentile(latencies, 99),
+        "max_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare completion fan-out executors")
+    parser.add_argument("--executors", default=",".join(EXECUTORS), help="comma-separated executors to compare")
+    parser.add_argument("--generations", type=int, default=50, help="concurrent generations")
+    parser.add_argument("--shards", type=int, default=6, help="shards per generation")
+    parser.add_argument("--questions", type=int, default=6, help="questions per generation")
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    args, fake_args = parser.parse_known_args()
+
+    if args.child:
+        print(json.dumps(run_executor(args.child, args.generations, args.shards, args.questions)))
+        sys.exit()
+
+    port = free_port()
+    fake = subprocess.Popen(
+        [sys.executable, str(EXPERIMENT_DIR.joinpath("fake_openai.py")), "--port", str(port),
+         *[arg for arg in fake_args if arg != "--"]],
+        stdout=subprocess.DEVNULL,
+    )
+    time.sleep(1)
+
+    env = {
+        **os.environ,
+        "OPENAI_API_BASE": f"http://127.0.0.1:{port}/v1",
+        "OPENAI_SECRET_KEY": "fake",
+
+        # measure the executors rather than the OpenAI throttle
+        "OPENAI_THROTTLE_URI": "memory://?max_requests=100000&tokens_per_minute=1000000000",
+    }
+
+    print(f"{args.generations} concurrent generations, {args.shards} shards, {args.questions} questions each")
+    print(f"{'executor':<10} {'total':>8} {'p50':>8} {'p95':>8} {'p99':>8} {'max rss':>10}")
+
+    try:
+        for executor in args.executors.split(","):
+            output = subprocess.run(
+                [sys.executable, __file__, "--child", executor, "--generations", str(args.generations),
+                 "--shards", str(args.shards), "--questions", str(args.questions)],
+                env=env, capture_output=True, text=True, check=True,
+            ).stdout
+            result = json.loads(output.strip().splitlines()[-1])
+
+            print(f"{executor:<10} {result['seconds']:>8.3f} {result['p50']:>8.3f} {result['p95']:>8.3f} "
+                  f"{result['p99']:>8.3f} {result['max_rss_mb']:>8.1f}MB")
+    finally:
+        fake.terminate()
@@ -0,0 +1,235 @@
+"""
+Local stand-in for the OpenAI API, serving canned template completions with
+configurable latency and injected errors. Point the server at it with:
+
+    OPENAI_API_BASE=http://localhost:8100/v1 OPENAI_SECRET_KEY=fake python main.py
+"""
+
+import argparse
+import asyncio
+import json
+import math
+import random
+import re
+import time
+from aiohttp import web
+
+# topics used to build distinct canned questions
+TOPICS = [
+    "ownership", "borrowing", "lifetimes", "traits", "generics", "closures",
+    "iterators", "pattern matching", "error handling", "smart pointers",
+    "concurrency", "modules", "macros", "slices", "enums", "structs",
+]
+
+QUESTION_TEMPLATE = (
+    "Question: Which statement about {topic} is true ({id})?\n"
+    "Correct answer: {topic} is checked at compile time\n"
+    "Incorrect answer: {topic} is checked by the garbage collector\n"
+    "Incorrect answer: {topic} is only available in unsafe code\n"
+    "Incorrect answer: {topic} has no effect on generated code"
+)
+
+# completion for a prompt ending in a custom question, see `add_answer_choices`
+ANSWER_CHOICES = (
+    "\nCorrect answer: The compiler rejects the program"
+    "\nIncorrect answer: The program panics at runtime"
+    "\nIncorrect answer: The value is copied implicitly"
+    "\nIncorrect answer: The program leaks memory"
+)
+
+# text that can't be parsed as questions, used to exercise retries
+MALFORMED = " I'm sorry, I can't write questions about this passage."
+
+# errors injected by `--rate-limit`, `--unavailable`, and `--server-error`
+ERRORS = {
+    "rate_limit": (429, "requests", "Rate limit reached for default-text-davinci-003."),
+    "unavailable": (503, "server_error", "The server is overloaded or not ready yet."),
+    "server_error": (500, "server_error", "The server had an error while processing your request."),
+}
+
+
+def parse_latency(spec: str):
+    """
+    Parses a latency distribution in seconds: `constant:2`, `uniform:1,4`, or
+    `lognormal:3,0.5` (median and sigma).
+    """
+
+    kind, _, args = spec.partition(":")
+    values = [float(value) for value in args.split(",")] if args else []
+
+    if kind == "constant":
+        return lambda: values[0]
+
+    if kind == "uniform":
+        return lambda: random.uniform(values[0], values[1])
+
+    if kind == "lognormal":
+        return lambda: random.lognormvariate(math.log(values[0]), values[1])
+
+    raise argparse.ArgumentTypeError(f"Unsupported latency distribution: {spec}")
+
+
+class FakeOpenAI:
+    def __init__(self, args):
+        self.latency = args.latency
+        self.stream_chunk = args.stream_chunk
+        self.error_rates = {
+            "rate_limit": args.rate_limit,
+            "unavailable": args.unavailable,
+            "server_error": args.server_error,
+        }
+        self.timeout_rate = args.timeout
+        self.malformed_rate = args.malformed
+
+        self.next_id = 0
+        self.stats = { "completions": 0, "edits": 0, "errors": 0, "timeouts": 0, "malformed": 0 }
+
+    def questions(self, num_questions: int) -> str:
+        blocks = []
+
+        for _ in range(num_questions):
+            self.next_id += 1
+            blocks.append(QUESTION_TEMPLATE.format(topic=random.choice(TOPICS), id=self.next_id))
+
+        # the prompt ends with "Question:", which isn't repeated by the completion
+        return "\n\n".join(blocks)[len("Question:"):]
+
+    def completion_text(self, prompt: str) -> str:
+        if random.random() < self.malformed_rate:
+            self.stats["malformed"] += 1
+            return MALFORMED
+
+        if not prompt.rstrip().endswith("Question:"):
+            return ANSWER_CHOICES
+
+        counts = re.findall(r"(\d+) multiple-choice questions:", prompt)
+        return self.questions(int(counts[-1]) if counts else 1)
+
+    async def fail(self):
+        """
+        Returns an error response, or hangs past the client's timeout, at the
+        configured rates.
+        """
+
+        if random.random() < self.timeout_rate:
+            self.stats["timeouts"] += 1
+            await asyncio.sleep(3600)
+
+        for name, rate in self.error_rates.items():
+            if random.random() < rate:
+                self.stats["errors"] += 1
+                status, error_type, message = ERRORS[name]
+                return web.json_response({ "error": { "message": message, "type": error_type } }, status=status)
+
+        return None
+
+    async def completions(self, request: web.Request):
+        body = await request.json()
+        self.stats["completions"] += 1
+
+        error = await self.fail()
+        if error:
+            return error
+
+        latency = self.latency()
+        model = request.match_info.get("engine", body.get("model"))
+        texts = [self.completion_text(body["prompt"]) for _ in range(body.get("n", 1))]
+
+        def completion(choices):
+            return {
+                "id": f"cmpl-fake-{self.next_id}",
+                "object": "text_completion",
+                "created": int(time.time()),
+                "model": model,
+                "choices": choices,
+            }
+
+        if not body.get("stream"):
+            await asyncio.sleep(latency)
+
+            choices = [
+                { "text": text, "index": index, "logprobs": None, "finish_reason": "stop" }
+                for index, text in enumerate(texts)
+            ]
+            return web.json_response({
+                **completion(choices),
+                "usage": {
+                    "prompt_tokens": len(body["prompt"]) // 4,
+                    "completion_tokens": sum(map(len, texts)) // 4,
+                    "total_tokens": (len(body["prompt"]) + sum(map(len, texts))) // 4,
+                },
+            })
+
+        # spread the latency over the streamed chunks
+        response = web.StreamResponse(headers={ "Content-Type": "text/event-stream" })
+        await response.prepare(request)
+
+        chunks = [
+            (index, text[start:start + self.stream_chunk])
+            for index, text in enumerate(texts)
+            for start in range(0, len(text), self.stream_chunk)
+        ]
+        for index, chunk in chunks:
+            await asyncio.sleep(latency / len(chunks))
+
+            choice = { "text": chunk, "index": index, "logprobs": None, "finish_reason": None }
+            await response.write(f"data: {json.dumps(completion([choice]))}\n\n".encode())
+
+        await response.write(b"data: [DONE]\n\n")
+        return response
+
+    async def edits(self, request: web.Request):
+        body = await request.json()
+        self.stats["edits"] += 1
+
+        error = await self.fail()
+        if error:
+            return error
+
+        await asyncio.sleep(self.latency())
+
+        # convert template blocks to the JSON requested by `EDIT_MODE_INSTRUCTION`
+        questions = []
+        for block in body["input"].strip().split("\n\n"):
+            lines = [line.partition(":")[2].strip() for line in block.splitlines()]
+
+            if len(lines) >= 3:
+                questions.append({ "question": lines[0], "correct": lines[1], "incorrect": lines[2:] })
+
+        return web.json_response({
+            "object": "edit",
+            "created": int(time.time()),
+            "choices": [{ "text": json.dumps(questions), "index": 0 }],
+        })
+
+    async def get_stats(self, request: web.Request):
+        return web.json_response(self.stats)
+
+    def app(self):
+        app = web.Application(client_max_size=16 * 1024 * 1024)
+        app.add_routes([
+            web.post("/v1/engines/{engine}/completions", self.completions),
+            web.post("/v1/completions", self.completions),
+            web.post("/v1/edits", self.edits),
+            web.get("/stats", self.get_stats),
+        ])
+
+        return app
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run a fake OpenAI API for offline benchmarks")
+    parser.add_argument("--port", type=int, default=8100)
+    parser.add_argument("--latency", type=parse_latency, default="lognormal:3,0.4",
+                        help="completion latency in seconds: constant:S, uniform:MIN,MAX or lognormal:MEDIAN,SIGMA")
+    parser.add_argument("--stream-chunk", type=int, default=8, help="characters per streamed event")
+    parser.add_argument("--rate-limit", type=float, default=0, help="fraction of requests failing with 429")
+    parser.add_argument("--unavailable", type=float, default=0, help="fraction of requests failing with 503")
+    parser.add_argument("--server-error", type=float, default=0, help="fraction of requests failing with 500")
+    parser.add_argument("--timeout", type=float, default=0, help="fraction of requests that never respond")
+    parser.add_argument("--malformed", type=float, default=0, help="fraction of completions that can't be parsed")
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    web.run_app(FakeOpenAI(args).app(), port=args.port)
@@ -0,0 +1,10 @@
+# gunicorn configuration for benchmark.py: the server's configuration,
+# running in the foreground so the benchmark can stop it
+import os
+
+SERVER_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.realpath(__file__)))), "server")
+
+with open(os.path.join(SERVER_DIR, "gunicorn_config.py")) as f:
+    exec(f.read())
+
+daemon = False
@@ -18,7 +18,7 @@ data = {
     "title": "Test quiz",
     "content": content,
     "count": NUM_QUESTIONS,
-    "is_markdown": True,
+    "content_type": "Markdown",
 }
 
 # call /upload route
@@ -0,0 +1,115 @@
+"""
+Checks that questions cut off by `max_tokens` are dropped and requested
+again, rather than saved with incomplete answer choices. Replays canned
+completions which stop with `finish_reason: "length"` partway through the
+last question, through the batched, streamed, and custom question paths.
+
+    python truncation.py
+"""
+
+import os
+import openai
+
+EXPERIMENT_DIR = os.path.dirname(os.path.realpath(__file__))
+
+# add parent dir to path to allow importing from server dir
+parent_dir = os.path.dirname(os.path.dirname(EXPERIMENT_DIR))
+os.sys.path.insert(0, os.path.join(parent_dir, "server"))
+from lib.completion import add_answer_choices, run_gpt3, stream_gpt3
+from lib.postprocess import postprocess_questions
+from lib.retry import RetryPolicy
+
+QUESTION = (
+    " What does the borrow checker check ({id})?\n"
+    "Correct answer: References never outlive their data\n"
+    "Incorrect answer: Values are freed by a garbage collector\n"
+    "Incorrect answer: Every variable is mutable\n"
+    "Incorrect answer: It runs at runtime"
+)
+
+# two complete questions, then a third cut off in its last distractor
+TRUNCATED = "\n\nQuestion:".join(QUESTION.format(id=id) for id in (1, 2, 3))[:-len("ime")]
+
+# a completion of the question requested again
+COMPLETE = QUESTION.format(id=4)
+
+# answer choices for a custom question, cut off in the last distractor
+ANSWER_CHOICES = "".join("\n" + line for line in QUESTION.format(id=5).splitlines()[1:])
+TRUNCATED_ANSWER_CHOICES = ANSWER_CHOICES[:-len("ime")]
+
+# no waiting between attempts
+POLICY = RetryPolicy(base_delay=0, max_delay=0)
+
+
+class ReplayCompletions:
+    """
+    Stands in for `openai.Completion.create`, returning each completion in
+    turn with its `finish_reason`, streamed in small chunks when requested.
+    """
+
+    def __init__(self, *completions):
+        self.completions = list(completions)
+        self.requests = []
+
+    def __call__(self, **params):
+        self.requests.append(params)
+        text, finish_reason = self.completions.pop(0)
+
+        if not params.get("stream"):
+            return { "choices": [{ "text": text, "index": 0, "finish_reason": finish_reason }] }
+
+        chunks = [text[start:start + 8] for start in range(0, len(text), 8)]
+        return (
+            { "choices": [{ "text": chunk, "index": 0, "finish_reason": finish_reason if position == len(chunks) - 1 else None }] }
+            for position, chunk in enumerate(chunks)
+        )
+
+
+def check_questions(questions, replay):
+    assert len(questions) == 3, questions
+    assert all(len(question["incorrect"]) == 3 for question in questions), questions
+    assert "It runs at runt" not in [answer for question in questions for answer in question["incorrect"]]
+
+    # only the cut off question is requested again
+    assert len(replay.requests) == 2
+    assert "1 multiple-choice questions:" in replay.requests[1]["prompt"]
+
+
+def check_postprocess():
+    parsed = postprocess_questions("Question:" + TRUNCATED, 3, fallback=False)
+    assert parsed[-1]["incorrect"][-1] == "It runs at runt", "the template parser accepts cut off questions"
+
+    parsed = postprocess_questions("Question:" + TRUNCATED, 3, fallback=False, truncated=True)
+    assert len(parsed) == 2, parsed
+
+
+def check_batch():
+    openai.Completion.create = replay = ReplayCompletions((TRUNCATED, "length"), (COMPLETE, "stop"))
+    check_questions(run_gpt3("", [3], POLICY, use_cache=False)[0], replay)
+
+
+def check_stream():
+    openai.Completion.create = replay = ReplayCompletions((TRUNCATED, "length"), (COMPLETE, "stop"))
+    streamed = []
+    questions = stream_gpt3("", [3], lambda _, question: streamed.append(question), POLICY, use_cache=False)[0]
+
+    check_questions(questions, replay)
+    assert streamed == questions
+
+
+def check_custom_question():
+    class Question:
+        question = "What does the borrow checker check?"
+        shard = 0
+
+    openai.Completion.create = replay = ReplayCompletions((TRUNCATED_ANSWER_CHOICES, "length"), (ANSWER_CHOICES, "stop"))
+    options = add_answer_choices("", Question(), POLICY)["options"]
+
+    assert [option["text"] for option in options][-1] == "It runs at runtime", options
+    assert len(replay.requests) == 2
+
+
+if __name__ == "__main__":
+    for check in (check_postprocess, check_batch, check_stream, check_custom_question):
+        check()
+        print(f"{check.__name__}: ok")
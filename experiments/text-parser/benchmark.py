@@ -0,0 +1,91 @@
+"""
+Compares the original plain-text parser, which read the whole upload and
+emitted a component per line, with the streaming paragraph parser in
+server/lib/parsers/text.py. Uploads are built by repeating the plai
+chapters up to the given sizes. Reports components, peak memory while
+parsing, and time to parse and shard.
+
+    python benchmark.py
+    python benchmark.py --sizes 1,4,16
+"""
+
+import argparse
+import glob
+import os
+import tempfile
+import time
+import tracemalloc
+
+EXPERIMENT_DIR = os.path.dirname(os.path.realpath(__file__))
+
+# add parent dir to path to allow importing from server dir
+parent_dir = os.path.dirname(os.path.dirname(EXPERIMENT_DIR))
+os.sys.path.insert(0, os.path.join(parent_dir, "server"))
+from lib.completion import shard_chapter
+from lib.parsers.text import parse_text
+from lib.parsers.tokens import load_tokenizer, tokenize_components
+
+
+# original parser, kept here for comparison
+def original_parse_text(content):
+    content = content.read()
+
+    delimiter = "\n"
+    chunks = [chunk + delimiter for chunk in content.split(delimiter)]
+
+    return tokenize_components(chunks)
+
+
+def write_upload(directory, megabytes):
+    chapters = "".join(open(path).read() for path in sorted(glob.glob(os.path.join(parent_dir, "experiments/plai/*.md"))))
+    path = os.path.join(directory, f"upload-{megabytes}.txt")
+
+    with open(path, "w") as f:
+        written = 0
+        while written < megabytes * 1024 * 1024:
+            written += f.write(chapters)
+
+    return path
+
+
+def measure(parser, path):
+    tracemalloc.start()
+    start = time.perf_counter()
+
+    with open(path) as upload:
+        components = parser(upload)
+
+    parse_seconds = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    start = time.perf_counter()
+    shards = shard_chapter(components)
+
+    return {
+        "components": len(components),
+        "shards": len(shards),
+        "parse": parse_seconds,
+        "shard": time.perf_counter() - start,
+        "peak_mb": peak / 1024 / 1024,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the plain-text parser")
+    parser.add_argument("--sizes", default="1,4", help="comma-separated upload sizes in megabytes")
+    args = parser.parse_args()
+
+    # load the tokenizer up front, so it isn't counted in the first measurement
+    load_tokenizer()
+
+    print(f"{'upload':>8} {'parser':<10} {'components':>10} {'shards':>7} {'parse':>8} {'shard':>8} {'peak':>9}")
+
+    with tempfile.TemporaryDirectory() as directory:
+        for megabytes in map(int, args.sizes.split(",")):
+            path = write_upload(directory, megabytes)
+
+            for name, parse in (("original", original_parse_text), ("streaming", parse_text)):
+                result = measure(parse, path)
+                print(f"{megabytes:>6}MB {name:<10} {result['components']:>10} {result['shards']:>7} "
+                      f"{result['parse']:>7.2f}s {result['shard']:>7.2f}s {result['peak_mb']:>7.1f}MB")
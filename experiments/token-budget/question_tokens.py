@@ -0,0 +1,65 @@
+"""
+Measures how many tokens a generated question uses in the template format
+from `Prompt.add_template`, to size `max_tokens` for completions. Uses the
+completions recorded in edit-mode-to-json and the hand-scored questions.
+
+    python question_tokens.py
+"""
+
+import glob
+import os
+import statistics
+
+EXPERIMENT_DIR = os.path.dirname(os.path.realpath(__file__))
+
+# add parent dir to path to allow importing from server dir
+parent_dir = os.path.dirname(os.path.dirname(EXPERIMENT_DIR))
+os.sys.path.insert(0, os.path.join(parent_dir, "server"))
+os.sys.path.insert(0, os.path.join(parent_dir, "experiments", "edit-mode-to-json"))
+from benchmark import load_sample
+from lib.parsers.tokens import count_tokens
+from lib.prompt import TEMPLATE
+
+
+def template_text(question, correct, incorrect):
+    lines = [TEMPLATE["question"] + question, TEMPLATE["correct"] + correct]
+    lines.extend(TEMPLATE["distractor"] + answer for answer in incorrect)
+
+    # questions are separated by a blank line
+    return "\n".join(lines) + "\n\n"
+
+
+def recorded_completions():
+    for path in sorted(glob.glob(os.path.join(parent_dir, "experiments", "edit-mode-to-json", "*.md"))):
+        _, expected = load_sample(path)
+
+        for question in expected:
+            yield template_text(question["question"], question["correct"], question["incorrect"])
+
+
+def hand_scored_questions():
+    for path in sorted(glob.glob(os.path.join(parent_dir, "experiments", "hand-scoring", "*", "questions", "*"))):
+        with open(path) as f:
+            blocks = f.read().strip().split("\n\n")
+
+        for block in blocks:
+            lines = block.splitlines()
+            correct = [line.partition(": ")[2] for line in lines[1:] if line.startswith("Correct")]
+            incorrect = [line.partition(": ")[2] for line in lines[1:] if line.startswith("Incorrect")]
+
+            if correct and incorrect:
+                yield template_text(lines[0], correct[0], incorrect)
+
+
+def report(name, texts):
+    tokens = sorted(count_tokens(list(texts)))
+    percentile = lambda fraction: tokens[min(len(tokens) - 1, round(fraction * (len(tokens) - 1)))]
+
+    print(f"{name}: {len(tokens)} questions, mean {statistics.mean(tokens):.1f}, "
+          f"stdev {statistics.stdev(tokens):.1f}, p95 {percentile(0.95)}, p99 {percentile(0.99)}, "
+          f"max {tokens[-1]} tokens")
+
+
+if __name__ == "__main__":
+    report("recorded completions", recorded_completions())
+    report("hand-scored questions", hand_scored_questions())
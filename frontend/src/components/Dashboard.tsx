@@ -1,12 +1,16 @@
-import { Container, Divider, Link, ListItem, Stack, Text, UnorderedList } from "@chakra-ui/react";
-import GenerationView from "@components/GenerationView";
+import { Button, Container, Divider, Link, ListItem, Stack, Text, UnorderedList } from "@chakra-ui/react";
+import GenerationSummaryView from "@components/GenerationSummaryView";
 import Upload from "@components/Upload";
 import useGenerations from "@hooks/useGenerations";
+import { useState } from "react";
 import CollapsibleAlert from "./CollapsibleAlert";
 import styles from "./Dashboard.module.css";
 
 const Dashboard: React.FC = () => {
-  const { isLoading, generations } = useGenerations();
+  const { isLoading, generations, hasMore, isLoadingMore, loadMore } = useGenerations();
+
+  // quiz created by the upload form, expanded so its questions are shown as they're generated
+  const [createdId, setCreatedId] = useState<number>();
 
   if (isLoading) {
     return <div>Loading generations...</div>;
@@ -34,7 +38,7 @@ const Dashboard: React.FC = () => {
         }
       />
 
-      <Upload />
+      <Upload onCreated={setCreatedId} />
 
       <Divider className={styles.divider} />
 
@@ -64,8 +68,12 @@ const Dashboard: React.FC = () => {
       }
 
       {generations?.map((g) => (
-        <GenerationView key={g} generation_id={g} />
+        <GenerationSummaryView key={g.id} summary={g} defaultExpanded={g.id === createdId} />
       ))}
+
+      {hasMore &&
+        <Button mb="2em" onClick={loadMore} isLoading={isLoadingMore}>Load more quizzes</Button>
+      }
     </Container>
   );
 }
@@ -3,6 +3,8 @@ import ReactDiffViewer from "react-diff-viewer";
 import { exportToText } from "./forms/utils";
 
 type GenerationDiffProps = { generation: Generation };
+
+/** Diff of a generation's original and edited text, `generation` must include deleted questions and answer choices */
 const GenerationDiff: React.FC<GenerationDiffProps> = ({ generation }) => {
     const original = exportToText(
         generation,
@@ -0,0 +1,49 @@
+import { Button, Text, useDisclosure } from "@chakra-ui/react";
+import { GENERATIONS_KEY } from "@hooks/useGenerations";
+import GenerationSummary from "@shared/generationsummary.type";
+import { useSWRConfig } from "swr";
+import GenerationView from "./GenerationView";
+import styles from "./GenerationView.module.css";
+
+type GenerationSummaryProps = { summary: GenerationSummary, defaultExpanded?: boolean };
+
+/** Quiz in the dashboard's list, only fetching its questions once expanded */
+const GenerationSummaryView: React.FC<GenerationSummaryProps> = ({ summary, defaultExpanded = false }) => {
+    const { isOpen, onOpen, onClose } = useDisclosure({ defaultIsOpen: defaultExpanded });
+    const { mutate } = useSWRConfig();
+
+    const collapse = () => {
+        onClose();
+
+        // pick up edits made while expanded, eg. to the title or number of questions
+        mutate(GENERATIONS_KEY);
+    };
+
+    if (isOpen) {
+        return <GenerationView generation_id={summary.id} onCollapse={collapse} />;
+    }
+
+    return (
+        <div style={{ marginBottom: "2em" }}>
+            <Text fontSize='2xl' className={styles["title-container"]}>
+                {summary.filename}
+
+                <Button
+                    size="xs"
+                    className={styles.utility}
+                    aria-label="Show questions"
+                    onClick={onOpen}
+                >
+                    Show Questions
+                </Button>
+            </Text>
+
+            <Text color="gray.500">
+                {summary.question_count} {summary.question_count === 1 ? "question" : "questions"},
+                last edited {new Date(summary.last_modified).toLocaleString()}
+            </Text>
+        </div>
+    );
+};
+
+export default GenerationSummaryView;
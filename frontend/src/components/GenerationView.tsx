@@ -12,8 +12,8 @@ import { useState } from "react";
 import { useGenerationDelete, useGenerationUpdate } from "@hooks/mutation/mutationHooks";
 import QuizUtilsModal, { UtilMode } from "./QuizUtilsModal";
 
-type GenerationProps = { generation_id: number };
-const GenerationView: React.FC<GenerationProps> = ({ generation_id }) => {
+type GenerationProps = { generation_id: number, onCollapse?: () => void };
+const GenerationView: React.FC<GenerationProps> = ({ generation_id, onCollapse }) => {
     const generation_url = `${API_URL}/generated/${generation_id}`;
 
     const { data: generation } = useSWR<Generation>(generation_url, fetcher);
@@ -69,6 +69,17 @@ const GenerationView: React.FC<GenerationProps> = ({ generation_id }) => {
                     Export
                 </Button>
 
+                {onCollapse &&
+                    <Button
+                        size="xs"
+                        className={styles.utility}
+                        aria-label="Hide questions"
+                        onClick={onCollapse}
+                    >
+                        Hide Questions
+                    </Button>
+                }
+
                 <LoadingIconButton
                     size="sm"
                     className={styles.remove}
@@ -1,17 +1,25 @@
 import { Button, FormControl, FormHelperText, Text } from "@chakra-ui/react";
 import uploadSchema, { CONTENT_TYPES } from "@schemas/upload.schema";
 import { Formik, Form, FormikHelpers } from "formik";
+import CheckboxField from "@components/fields/CheckboxField";
 import SelectField from "@components/fields/SelectField";
 import TextareaField from "@components/fields/TextareaField";
 import TextField from "@components/fields/TextField";
 import { useGenerationCreate } from "@hooks/mutation/mutationHooks";
+import useErrorToast from "@hooks/useErrorToast";
 
-const Upload: React.FC = () => {
-    const createGeneration = useGenerationCreate();
+type UploadProps = { onCreated?: (generationId: number) => void };
+const Upload: React.FC<UploadProps> = ({ onCreated }) => {
+    const createGeneration = useGenerationCreate(onCreated);
+    const showError = useErrorToast();
 
     const upload = async (data: any, { resetForm }: FormikHelpers<any>) => {
-        await createGeneration(data);
-        resetForm();
+        try {
+            await createGeneration(data);
+            resetForm();
+        } catch (error) {
+            showError(error);
+        }
     }
 
     return (
@@ -38,12 +46,16 @@ const Upload: React.FC = () => {
                     <SelectField name="content_type" title="Content format" values={CONTENT_TYPES} />
 
                     <TextField name="count" title="Number of Questions" />
+
+                    <CheckboxField name="long_document" type="checkbox" title="Long document (whole chapters or books)" />
+
+                    <CheckboxField name="regenerate" type="checkbox" title="Generate new questions (don't reuse questions from an identical upload)" />
                     
                     <Button type="submit" isLoading={props.isSubmitting}>Create quiz</Button>
 
                     {props.isSubmitting && 
                         <FormControl>
-                            <FormHelperText>It may take a few minutes for questions to generate</FormHelperText>
+                            <FormHelperText>Questions are added to your quiz below as they're generated</FormHelperText>
                         </FormControl>
                     }
                 </Form>
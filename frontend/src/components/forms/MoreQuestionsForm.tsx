@@ -1,5 +1,6 @@
 import { Button } from "@chakra-ui/react";
 import { useQuestionAdd } from "@hooks/mutation/mutationHooks";
+import useErrorToast from "@hooks/useErrorToast";
 import addQuestionsSchema from "@schemas/addQuestions.schema";
 import { Formik, Form } from "formik";
 import TextField from "../fields/TextField";
@@ -7,10 +8,15 @@ import { QuizUtilFormProps } from "./shared";
 
 const MoreQuestionsForm: React.FC<QuizUtilFormProps> = ({ generation, onClose }) => {
     const addQuestions = useQuestionAdd(generation.id);
+    const showError = useErrorToast();
 
     const submit = async (data: any) => {
-        await addQuestions(data);
-        onClose();
+        try {
+            await addQuestions(data);
+            onClose();
+        } catch (error) {
+            showError(error);
+        }
     }
 
     return (
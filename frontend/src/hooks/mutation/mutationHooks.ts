@@ -1,8 +1,14 @@
+import api from "@shared/api";
 import AnswerChoice from "@shared/answerchoice.type";
-import { ALL_GENERATIONS_URL, API_URL } from "@shared/consts";
+import { API_URL } from "@shared/consts";
 import { FeedbackTypes, getNewFeedback } from "@shared/feedback.type";
 import Generation from "@shared/generation.type";
+import Job from "@shared/job.type";
+import { GENERATIONS_KEY } from "@hooks/useGenerations";
+import { useSWRConfig } from "swr";
 import { deleteQuestionOptimistic, giveFeedbackOptimistic } from "./optimisticData";
+import streamQuestions, { addStreamedQuestion } from "./streamQuestions";
+import useMutationJob from "./useMutationJob";
 import useMutationPost, { MutationPostOptions } from "./useMutationPost";
 
 const getGenerationURL = (generationId: number) => `${API_URL}/generated/${generationId}`;
@@ -21,7 +27,7 @@ export const useCustomQuestion = (generationId: number, options?: MutationPostOp
 /** Delete a quiz */
 export const useGenerationDelete = (generationId: number, options?: MutationPostOptions) => {
     const { trigger } = useMutationPost(
-        ALL_GENERATIONS_URL,
+        GENERATIONS_KEY,
         `${API_URL}/generated/${generationId}/delete`,
         options
     );
@@ -30,8 +36,8 @@ export const useGenerationDelete = (generationId: number, options?: MutationPost
 }
 
 /** Add multiple questions */
-export const useQuestionAdd = (generationId: number, options?: MutationPostOptions) => {
-    const { trigger } = useMutationPost(
+export const useQuestionAdd = (generationId: number, options?: MutationPostOptions<Job>) => {
+    const { trigger } = useMutationJob(
         getGenerationURL(generationId),
         `${API_URL}/generated/${generationId}/more`,
         options
@@ -51,15 +57,31 @@ export const useGenerationUpdate = (generationId: number, options?: MutationPost
     return (data: any) => trigger(data);
 }
 
-/** Create a quiz */
-export const useGenerationCreate = (options?: MutationPostOptions) => {
-    const { trigger } = useMutationPost(
-        ALL_GENERATIONS_URL,
-        `${API_URL}/upload`,
-        options
-    );
-
-    return (data: any) => trigger(data);
+/** Create a quiz, streaming its questions into the dashboard as each is generated */
+export const useGenerationCreate = (onCreated?: (generationId: number) => void) => {
+    const { mutate } = useSWRConfig();
+
+    return async (data: any) => {
+        const { regenerate, ...upload } = data;
+        const { data: created } = await api.post(`${API_URL}/upload`, { ...upload, cache: !regenerate, stream: true });
+        const generationURL = getGenerationURL(created.generation_id);
+
+        // show the new quiz right away
+        onCreated?.(created.generation_id);
+        await mutate(GENERATIONS_KEY);
+
+        try {
+            await streamQuestions(
+                created.generation_id,
+                data.count,
+                question => mutate<Generation>(generationURL, generation => addStreamedQuestion(generation, question), { revalidate: false }),
+                !regenerate,
+            );
+        } finally {
+            // pick up the saved revision, or remove the quiz if nothing could be generated
+            await Promise.all([mutate(generationURL), mutate(GENERATIONS_KEY)]);
+        }
+    };
 }
 
 /** Update a question */
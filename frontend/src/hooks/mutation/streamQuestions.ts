@@ -0,0 +1,52 @@
+import { API_URL, SERVER_URL } from "@shared/consts";
+import Generation from "@shared/generation.type";
+import Question from "@shared/question.type";
+
+/** Add a streamed question to cached generation data, unless it was already fetched */
+export const addStreamedQuestion = (current: Generation | undefined, question: Question) => {
+    if (!current || current.questions.some(q => q.id === question.id)) {
+        return current;
+    }
+
+    return { ...current, questions: [...current.questions, question] };
+}
+
+/**
+ * Stream new questions for a generation as server-sent events, calling `onQuestion`
+ * as soon as each is saved. Resolves once every job has finished, or rejects with
+ * the first job's error. Without `useCache`, questions aren't reused from identical uploads.
+ */
+const streamQuestions = (generationId: number, count: number, onQuestion: (question: Question) => void, useCache = true) =>
+    new Promise<void>((resolve, reject) => {
+        const source = new EventSource(
+            `${SERVER_URL}${API_URL}/generated/${generationId}/stream?count=${count}&cache=${useCache}`,
+            { withCredentials: true }
+        );
+        const errors: string[] = [];
+
+        source.addEventListener("question", event => onQuestion(JSON.parse(event.data)));
+
+        source.addEventListener("error", event => {
+            // a job failed, the stream continues with the other jobs
+            if (event instanceof MessageEvent) {
+                errors.push(JSON.parse(event.data).message);
+                return;
+            }
+
+            // connection failed, stop the browser from reconnecting and generating again
+            source.close();
+            reject(new Error("Lost connection to Quizicist while generating questions. Refresh the page to see your quiz."));
+        });
+
+        source.addEventListener("done", () => {
+            source.close();
+
+            if (errors.length > 0) {
+                reject(new Error(errors[0]));
+            } else {
+                resolve();
+            }
+        });
+    });
+
+export default streamQuestions;
@@ -0,0 +1,59 @@
+import api from "@shared/api";
+import { API_URL } from "@shared/consts";
+import Job, { JobStatus } from "@shared/job.type";
+import useSWRMutation from "swr/mutation";
+import { MutationPostOptions } from "./useMutationPost";
+
+// milliseconds between job status requests
+const POLL_INTERVAL = 2000;
+
+// milliseconds to wait for a job before giving up, allowing for time in the queue
+const JOB_TIMEOUT = 10 * 60 * 1000;
+
+// consecutive failed job status requests before giving up
+const MAX_POLL_ERRORS = 5;
+
+/** Poll a background job until it completes, throwing if it fails, times out, or can't be reached */
+export const waitForJob = async (jobId: number): Promise<Job> => {
+    const deadline = Date.now() + JOB_TIMEOUT;
+    let errors = 0;
+
+    while (Date.now() < deadline) {
+        let job: Job | undefined;
+
+        try {
+            ({ data: job } = await api.get<Job>(`${API_URL}/jobs/${jobId}`));
+            errors = 0;
+        } catch (error) {
+            errors += 1;
+
+            if (errors >= MAX_POLL_ERRORS) {
+                throw new Error("Lost connection to Quizicist while generating questions. Refresh the page to see your quiz.");
+            }
+        }
+
+        if (job?.status === JobStatus.complete) {
+            return job;
+        }
+
+        if (job?.status === JobStatus.failed) {
+            throw new Error(job.error ?? "Question generation failed");
+        }
+
+        await new Promise(resolve => setTimeout(resolve, POLL_INTERVAL));
+    }
+
+    throw new Error("Question generation is taking longer than expected. Refresh the page later to see your quiz.");
+};
+
+/** POST to a route that queues a job, resolving once the job completes */
+function useMutationJob(mutationURL: string, postURL: string, options?: MutationPostOptions<Job>) {
+    const post = async (_url: string, { arg }: any) => {
+        const { data } = await api.post(postURL, arg);
+        return waitForJob(data.job_id);
+    };
+
+    return useSWRMutation(mutationURL, post, options);
+}
+
+export default useMutationJob;
@@ -0,0 +1,16 @@
+import { useToast } from "@chakra-ui/react";
+
+/** Show a popup for an error from a request or background job, with the backend's message when there is one */
+function useErrorToast() {
+    const toast = useToast();
+
+    return (error: any) => toast({
+        title: "Quizicist ran into an error",
+        description: error.response?.data?.message ?? error.message,
+        status: "error",
+        duration: 9000,
+        isClosable: true,
+    });
+}
+
+export default useErrorToast;
@@ -1,12 +1,32 @@
-import useSWR from "swr";
-import { ALL_GENERATIONS_URL } from "@shared/consts";
+import useSWRInfinite, { unstable_serialize } from "swr/infinite";
+import { GENERATIONS_URL } from "@shared/consts";
+import { GenerationPage } from "@shared/generationsummary.type";
 import { fetcher } from "./fetcher";
 
+/** URL of each page of generations, continuing from the previous page's cursor */
+const getGenerationsPage = (index: number, previous: GenerationPage | null) => {
+  if (index === 0) {
+    return GENERATIONS_URL;
+  }
+
+  if (!previous?.next_cursor) {
+    return null;
+  }
+
+  return `${GENERATIONS_URL}?cursor=${previous.next_cursor}`;
+};
+
+/** Cache key of the generation list, revalidated by mutations which add or remove generations */
+export const GENERATIONS_KEY = unstable_serialize(getGenerationsPage);
+
 function useGenerations() {
-  const { data, error } = useSWR<number[]>(ALL_GENERATIONS_URL, fetcher)
+  const { data, error, size, setSize } = useSWRInfinite<GenerationPage>(getGenerationsPage, fetcher);
 
   return {
-    generations: data,
+    generations: data?.flatMap(page => page.generations),
+    hasMore: !!data?.[data.length - 1]?.next_cursor,
+    isLoadingMore: !!data && typeof data[size - 1] === "undefined",
+    loadMore: () => setSize(size + 1),
     isLoading: !error && !data,
     isError: error
   }
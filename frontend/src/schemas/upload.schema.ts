@@ -18,6 +18,14 @@ const uploadSchema = yup.object({
         .oneOf(CONTENT_TYPES)
         .default(CONTENT_TYPES[0])
         .label("Content type"),
+    long_document: yup
+        .boolean()
+        .default(false)
+        .label("Long document"),
+    regenerate: yup
+        .boolean()
+        .default(false)
+        .label("Generate new questions"),
 });
 
 export default uploadSchema;
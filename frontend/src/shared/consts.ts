@@ -5,4 +5,4 @@ export const SERVER_URL = process.env.NODE_ENV === "production" ?
 export const API_URL = `/api`;
 export const AUTH_URL = `/auth`;
 
-export const ALL_GENERATIONS_URL = `${API_URL}/generated/all`;
+export const GENERATIONS_URL = `${API_URL}/generated`;
@@ -3,8 +3,12 @@ import Question from "./question.type";
 type Generation = {
     id: number;
     filename: string;
-    unique_filename: string;
+    unique_filename: string | null;
+    content_hash: string | null;
+    // `/api/generated/<id>` leaves out deleted questions and answer choices unless requested with `?deleted=true`,
+    // the admin dashboard's generations always include them
     questions: Question[];
+    revision: number;
 };
 
 export default Generation;
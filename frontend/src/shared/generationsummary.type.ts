@@ -0,0 +1,16 @@
+type GenerationSummary = {
+    id: number;
+    filename: string;
+    content_type: string;
+    created_at: string;
+    last_modified: string;
+    revision: number;
+    question_count: number;
+};
+
+export type GenerationPage = {
+    generations: GenerationSummary[];
+    next_cursor: number | null;
+};
+
+export default GenerationSummary;
@@ -0,0 +1,27 @@
+export enum JobStatus {
+    queued = 0,
+    running = 1,
+    complete = 2,
+    failed = 3,
+}
+
+export type JobShard = {
+    id: number;
+    job_id: number;
+
+    shard: number;
+    num_questions: number;
+    status: JobStatus;
+};
+
+type Job = {
+    id: number;
+    generation_id: number;
+
+    num_questions: number;
+    status: JobStatus;
+    error: string | null;
+    shards: JobShard[];
+};
+
+export default Job;
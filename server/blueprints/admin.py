@@ -5,9 +5,11 @@ from db import db
 from flask import Blueprint, request
 from flask_bcrypt import Bcrypt
 from flask_login import current_user
-from models import Generation, User
+from models import Generation, Question, User
+from lib.parsers.tokens import tokenizer_metrics
 import os
 from limiter import limiter
+from sqlalchemy.orm import selectinload
 
 # routes for admin dashboard
 admin = Blueprint("admin", __name__, template_folder="templates")
@@ -62,7 +64,12 @@ def get_generations():
         "percent_answers_scored",
     ]
 
-    generations: List[Generation] = Generation.query.all()
+    # load questions and answer choices for all generations up front, rather than once per generation
+    generations: List[Generation] = Generation.query.options(
+        selectinload(Generation.questions).selectinload(Question.answers),
+        selectinload(Generation.undeleted_questions).selectinload(Question.undeleted_answers),
+        selectinload(Generation.exports),
+    ).all()
     generations = list(filter(lambda generation: generation.interacted_with, generations))
 
     # dirty hack to display all custom properties in JSON
@@ -83,3 +90,9 @@ def get_generations():
         serialized.append(generation)
 
     return serialized
+
+
+# tokenizer load metrics for the worker serving this request
+@admin.route("/metrics/tokenizer", methods=["GET"])
+def get_tokenizer_metrics():
+    return tokenizer_metrics()
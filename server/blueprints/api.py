@@ -1,12 +1,15 @@
-from flask import Blueprint, jsonify, request
+from flask import Blueprint, Response, current_app, jsonify, request, stream_with_context
 from flask_login import current_user
-from lib.consts import ExportTypes
-from lib.errors import QuizicistError
+from lib.completion import plan_completion, stream_jobs
+from lib.cache import generation_cache
+from lib.consts import ExportTypes, GENERATIONS_PAGE_SIZE, JobTypes, MAX_GENERATIONS_PAGE_SIZE
+from lib.errors import QuizicistError, error_message
 from lib.export import GoogleFormExport
 from lib.files import create_file_from_json
 from lib.mdbook import questions_to_toml
-from models import AnswerChoice, Export, Generation, Question, Message
+from models import AnswerChoice, Export, Generation, Job, Question, Message
 from db import db
+from jobqueue import job_queue
 from limiter import limiter
 import openai.error as OpenAIError
 
@@ -24,6 +27,29 @@ def require_authentication():
         return { "message": "Authentication required" }, 401
 
 
+def conditional_response(etag: str, make_response):
+    """
+    Responds with 304 Not Modified when the client already has the version
+    tagged `etag`, otherwise calls `make_response` for the full response.
+    """
+
+    if request.if_none_match.contains(etag):
+        response = current_app.response_class(status=304)
+    else:
+        response = current_app.make_response(make_response())
+
+    # clients revalidate cached responses on every request
+    response.set_etag(etag)
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    return response
+
+
+# strong ETag for a representation of a generation, changing with its revision
+def generation_etag(generation: Generation, representation: str):
+    return f"{representation}-{generation.id}-{generation.revision}"
+
+
 # create quiz from markdown/text content
 @api.route("/upload", methods=["POST"])
 @limiter.limit("10/hour")
@@ -41,36 +67,91 @@ def upload():
         return "Invalid content type", 400
 
     # save uploaded file
-    filename, unique_filename = create_file_from_json()
+    filename, content_hash = create_file_from_json()
 
     # create generation instance in database
     generation = Generation(
         user_id=current_user.id,
         filename=filename,
-        unique_filename=unique_filename,
-        content_type=content_type
+        content_hash=content_hash,
+        content_type=content_type,
+        long_document=bool(request.json.get("long_document", False)),
     )
     db.session.add(generation)
+    db.session.commit()
 
-    # run completion, add generated questions to database
-    generation.add_questions(num_questions)
+    # parse uploaded content once, reused by every completion and by identical uploads
+    generation.create_shards()
 
-    db.session.commit()
+    # reject content the worker couldn't generate questions for, eg. too long, before queueing it
+    try:
+        plan_completion([shard.text for shard in generation.content_shards], num_questions, generation.long_document)
+    except QuizicistError as e:
+        db.session.delete(generation)
+        db.session.commit()
+
+        return { "message": str(e) }, 400
+
+    # client streams questions from `/generated/<generation_id>/stream` instead of waiting for a job
+    if request.json.get("stream", False):
+        return {
+            "message": f"Created generation for {filename}",
+            "generation_id": generation.id,
+        }, 201
+
+    # queue completion, worker adds generated questions to database
+    # identical uploads reuse cached completions unless the client asks for fresh questions
+    use_cache = bool(request.json.get("cache", True))
+    job = job_queue.enqueue(generation, JobTypes.upload, num_questions, use_cache)
 
     return {
-        "message": f"Completed generation for {filename}"
-    }
+        "message": f"Queued generation for {filename}",
+        "generation_id": generation.id,
+        "job_id": job.id,
+    }, 202
 
 
 # return all generations as JSON
 @api.route("/generated/all")
 def all_generations():
-    # TODO: select id from the query level
-    generations = Generation.query \
-        .filter_by(user_id=current_user.id) \
-        .order_by(Generation.id.desc()).all()
+    generation_ids = db.session.query(Generation.id) \
+        .filter(Generation.user_id == current_user.id, Generation.deleted == db.false()) \
+        .order_by(Generation.id.desc())
+
+    return jsonify([generation_id for generation_id, in generation_ids])
+
 
-    return jsonify([g.id for g in generations])
+# return a page of generation summaries, newest first, continuing before the `cursor` generation ID
+@api.route("/generated")
+def list_generations():
+    cursor = request.args.get("cursor", type=int)
+    limit = min(max(request.args.get("limit", GENERATIONS_PAGE_SIZE, type=int), 1), MAX_GENERATIONS_PAGE_SIZE)
+
+    question_count = db.select(db.func.count(Question.id)) \
+        .where(Question.generation_id == Generation.id, Question.deleted == db.false()) \
+        .scalar_subquery()
+
+    query = db.session.query(
+        Generation.id,
+        Generation.filename,
+        Generation.content_type,
+        Generation.created_at,
+        db.func.coalesce(Generation.updated_at, Generation.created_at).label("last_modified"),
+        Generation.revision,
+        question_count.label("question_count"),
+    ).filter(Generation.user_id == current_user.id, Generation.deleted == db.false())
+
+    if cursor is not None:
+        query = query.filter(Generation.id < cursor)
+
+    # fetch an extra row to tell whether there's another page
+    rows = query.order_by(Generation.id.desc()).limit(limit + 1).all()
+    generations = [dict(row._mapping) for row in rows[:limit]]
+
+    return jsonify({
+        "generations": generations,
+        "next_cursor": generations[-1]["id"] if len(rows) > limit else None,
+    })
 
 
 # return single generation as JSON
@@ -79,7 +160,21 @@ def get_generation(generation_id):
     generation: Generation = db.get_or_404(Generation, generation_id)
     generation.check_ownership(current_user.id)
 
-    return jsonify(generation)
+    # deleted questions and answer choices are left out, unless requested with `?deleted=true`
+    include_deleted = request.args.get("deleted", "false") == "true"
+    representation = "json-deleted" if include_deleted else "json"
+
+    # serialized once per revision, since most requests are for unchanged generations
+    def serialize():
+        payload = generation_cache.get_or_compute(
+            generation.id,
+            generation.revision,
+            lambda: generation.to_json(include_deleted),
+            representation,
+        )
+        return current_app.response_class(payload, mimetype="application/json")
+
+    return conditional_response(generation_etag(generation, representation), serialize)
 
 
 # update a quiz's data
@@ -114,12 +209,87 @@ def generate_more(generation_id):
     if num_questions > 10 or num_questions < 1:
         return "Invalid number of questions", 400
 
-    # run completion, add generated questions to database
-    generation.add_questions(num_questions)
+    # queue completion, worker adds generated questions to database
+    # cached completions would repeat questions the generation already has
+    job = job_queue.enqueue(generation, JobTypes.more, num_questions, use_cache=False)
 
     return {
-        "message": f"Added questions for {generation.filename}"
-    }
+        "message": f"Queued questions for {generation.filename}",
+        "job_id": job.id,
+    }, 202
+
+
+def sse_event(event, data):
+    return f"event: {event}\ndata: {current_app.json.dumps(data)}\n\n"
+
+
+# stream new questions as server-sent events as soon as each is generated,
+# for a new quiz uploaded with `stream` or to add questions to an existing one
+@api.route("/generated/<generation_id>/stream")
+@limiter.limit("10/hour")
+def stream_more(generation_id):
+    generation: Generation = db.get_or_404(Generation, generation_id)
+    generation.check_ownership(current_user.id)
+
+    num_questions = request.args.get("count", type=int)
+
+    if num_questions is None:
+        return "Missing number of questions in request", 400
+
+    # a new quiz's first questions are limited like uploads, later ones like `generate_more`,
+    # a quiz whose questions were all deleted isn't new, deleted questions are included
+    initial = not generation.questions
+    if num_questions > (15 if initial else 10) or num_questions < 1:
+        return "Invalid number of questions", 400
+
+    shards = [shard.text for shard in generation.content_shards]
+    jobs = plan_completion(shards, num_questions, generation.long_document)
+
+    # identical uploads reuse cached completions unless the client asks for fresh questions,
+    # cached completions would repeat questions an existing generation already has
+    use_cache = initial and request.args.get("cache", "true") == "true"
+
+    def events():
+        saved = 0
+
+        for event, index, value in stream_jobs(shards, jobs, use_cache=use_cache):
+            shard, _ = jobs[index]
+
+            # save each question before sending it, so it's included in later fetches
+            if event == "question":
+                question = generation.add_question(value, shard)
+                db.session.commit()
+                saved += 1
+                yield sse_event("question", question)
+
+            elif event == "complete":
+                yield sse_event("shard", { "job": index, "shard": shard })
+
+            else:
+                yield sse_event("error", { "job": index, "shard": shard, "message": error_message(value) })
+
+        # don't leave an empty quiz on the dashboard when none of its questions could be generated,
+        # only for a quiz that has never had questions
+        if initial and not saved:
+            generation.deleted = True
+            db.session.commit()
+
+        yield sse_event("done", { "generation_id": generation.id })
+
+    return Response(
+        stream_with_context(events()),
+        mimetype="text/event-stream",
+        headers={ "Cache-Control": "no-cache" },
+    )
+
+
+# return status of a question generation job
+@api.route("/jobs/<job_id>")
+def get_job(job_id):
+    job: Job = db.get_or_404(Job, job_id)
+    job.check_ownership(current_user.id)
+
+    return jsonify(job)
 
 
 # delete a generation
@@ -324,26 +494,14 @@ def download_toml(generation_id):
     generation: Generation = db.get_or_404(Generation, generation_id)
     generation.check_ownership(current_user.id)
 
-    return questions_to_toml(generation.questions)
+    return conditional_response(generation_etag(generation, "toml"), lambda: questions_to_toml(generation.undeleted_questions))
 
 @api.errorhandler(QuizicistError)
 def handle_quizicist_error(e):
     return { "message": str(e) }, 500
 
 @api.errorhandler(OpenAIError.ServiceUnavailableError)
-def handle_service_unavailable():
-    return {
-        "message": "OpenAI is experiencing server issues. Please wait a few minutes and try again."
-    }, 500
-
 @api.errorhandler(OpenAIError.RateLimitError)
-def handle_rate_limit():
-    return {
-        "message": "We're currently experiencing high demand. Please wait a few minutes and try again."
-    }, 500
-
 @api.errorhandler(OpenAIError.Timeout)
-def handle_timeout():
-    return {
-        "message": "OpenAI took too long to respond. Please try again. If the error is not resolved, please submit feedback detailing your error."
-    }, 500
+def handle_openai_error(e):
+    return { "message": error_message(e) }, 500
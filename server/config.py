@@ -21,6 +21,10 @@ class Config(object):
     # allow Content-Type header cross-origin
     CORS_HEADERS = "Content-Type"
 
+    # run completions on greenlets in gevent workers, otherwise in a shared thread pool,
+    # read from the same variable `worker.py` checks to monkey-patch for gevent
+    COMPLETION_EXECUTOR = os.environ.get("COMPLETION_EXECUTOR", "auto")
+
 
 # for use in local development
 class DebugConfig(Config):
@@ -32,6 +36,18 @@ class DebugConfig(Config):
 
     # store flask limiter data in memory
     RATELIMIT_STORAGE_URI = "memory://"
+
+    # workers poll the local database for queued generation jobs
+    JOB_QUEUE_URI = "database://"
+
+    # cache completions in memory
+    COMPLETION_CACHE_URI = "memory://"
+
+    # cache serialized generations in memory
+    GENERATION_CACHE_URI = "memory://"
+
+    # limit OpenAI requests per process
+    OPENAI_THROTTLE_URI = "memory://"
     
 
 # for use in production environment (Google VM)
@@ -44,5 +60,17 @@ class ProductionConfig(Config):
     # store flask limiter data in memcached
     RATELIMIT_STORAGE_URI = "memcached://localhost:11211"
 
+    # queue generation jobs in memcached
+    JOB_QUEUE_URI = "memcached://localhost:11211"
+
+    # share cached completions between workers in memcached
+    COMPLETION_CACHE_URI = "memcached://localhost:11211"
+
+    # share serialized generations between workers in memcached
+    GENERATION_CACHE_URI = "memcached://localhost:11211"
+
+    # limit OpenAI requests across all workers in memcached
+    OPENAI_THROTTLE_URI = "memcached://localhost:11211"
+
     # allow requests only from quizici.st
     CORS_ORIGINS = ["https://quizici.st"]
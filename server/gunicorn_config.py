@@ -9,3 +9,10 @@ timeout = 180
 keepalive = 2
 
 daemon = True
+
+
+# load the tokenizer once in the master process before workers fork,
+# so every worker shares the same copy of the vocabulary
+def when_ready(server):
+    from lib.parsers.tokens import load_tokenizer
+    load_tokenizer()
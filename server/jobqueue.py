@@ -0,0 +1,196 @@
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+import threading
+import time
+from typing import Iterable, Optional
+from urllib.parse import urlparse
+from pymemcache.client.base import Client
+from db import db
+from lib.consts import JOB_HEARTBEAT_INTERVAL, JOB_HEARTBEAT_TIMEOUT, JobStatus, JobTypes
+from models import Generation, Job
+
+
+class DatabaseBackend:
+    """
+    Finds queued jobs by polling the `job` table. Works across processes with
+    both the SQLite and MySQL databases, so no extra services are required.
+    """
+
+    def push(self, job_id: int):
+        # queued jobs are already stored in the database
+        pass
+
+    def candidates(self) -> Iterable[int]:
+        job = Job.query.filter_by(status=JobStatus.queued).order_by(Job.id).first()
+        return [job.id] if job else []
+
+
+class MemcachedBackend:
+    """
+    Stores IDs of queued jobs in memcached, avoiding polling the database.
+
+    The queue is a pair of counters: `push` increments the tail and stores the
+    job ID under the new index, `candidates` advances the head with
+    compare-and-swap so each index is handed to a single worker.
+    """
+
+    HEAD_KEY = "quizicist:jobs:head"
+    TAIL_KEY = "quizicist:jobs:tail"
+
+    # attempts to read a job ID while its `push` is still in progress
+    ITEM_READ_ATTEMPTS = 5
+
+    def __init__(self, host: str, port: int):
+        self.client = Client((host, port))
+
+    def item_key(self, index: int):
+        return f"quizicist:jobs:{index}"
+
+    def counter(self, key: str) -> int:
+        self.client.add(key, b"0", noreply=False)
+        return int(self.client.get(key))
+
+    def push(self, job_id: int):
+        self.counter(self.TAIL_KEY)
+        index = self.client.incr(self.TAIL_KEY, 1)
+        self.client.set(self.item_key(index), str(job_id).encode())
+
+    def candidates(self) -> Iterable[int]:
+        self.counter(self.HEAD_KEY)
+        head, cas = self.client.gets(self.HEAD_KEY)
+        head = int(head)
+
+        if head >= self.counter(self.TAIL_KEY):
+            return []
+
+        # another worker claimed this index first
+        if not self.client.cas(self.HEAD_KEY, str(head + 1).encode(), cas, noreply=False):
+            return []
+
+        key = self.item_key(head + 1)
+        for _ in range(self.ITEM_READ_ATTEMPTS):
+            job_id = self.client.get(key)
+
+            if job_id is not None:
+                self.client.delete(key)
+                return [int(job_id)]
+
+            time.sleep(0.1)
+
+        # the pushing worker failed before storing the ID, fall back to the database so the job isn't skipped,
+        # `JobQueue.recover` pushes it again if it's still waiting
+        return DatabaseBackend().candidates()
+
+
+def create_backend(uri: str):
+    parsed = urlparse(uri)
+
+    if parsed.scheme == "database":
+        return DatabaseBackend()
+
+    if parsed.scheme == "memcached":
+        return MemcachedBackend(parsed.hostname or "localhost", parsed.port or 11211)
+
+    raise ValueError(f"Unsupported job queue URI: {uri}")
+
+
+class JobQueue:
+    """
+    Queue of question generation jobs, run by `worker.py`.
+
+    Jobs are always stored in the database, which tracks their status. The
+    configured backend (`JOB_QUEUE_URI`) only tells workers which jobs to run.
+    """
+
+    def __init__(self):
+        self.backend = None
+
+    def init_app(self, app):
+        self.backend = create_backend(app.config.get("JOB_QUEUE_URI", "database://"))
+
+    def enqueue(self, generation: Generation, job_type: JobTypes, num_questions: int, use_cache=True) -> Job:
+        job = Job(
+            generation_id=generation.id,
+            job_type=job_type,
+            num_questions=num_questions,
+            use_cache=use_cache,
+            heartbeat_at=datetime.now(),
+        )
+        db.session.add(job)
+        db.session.commit()
+
+        self.backend.push(job.id)
+        return job
+
+    def claim(self, job_id: int) -> Optional[Job]:
+        # only one worker can move a job out of the queued state
+        claimed = Job.query \
+            .filter_by(id=job_id, status=JobStatus.queued) \
+            .update({ "status": JobStatus.running, "started_at": datetime.now(), "heartbeat_at": datetime.now() })
+        db.session.commit()
+
+        return db.session.get(Job, job_id) if claimed else None
+
+    def dequeue(self) -> Optional[Job]:
+        for job_id in self.backend.candidates():
+            job = self.claim(job_id)
+
+            if job:
+                return job
+
+        return None
+
+    @contextmanager
+    def heartbeat(self, app, job_id: int):
+        """
+        Reports that the job is still running every `JOB_HEARTBEAT_INTERVAL`
+        seconds while the block runs, so it isn't recovered as lost.
+        """
+
+        stopped = threading.Event()
+
+        def beat():
+            while not stopped.wait(JOB_HEARTBEAT_INTERVAL):
+                with app.app_context():
+                    Job.query \
+                        .filter_by(id=job_id, status=JobStatus.running) \
+                        .update({ "heartbeat_at": datetime.now() })
+                    db.session.commit()
+
+        thread = threading.Thread(target=beat, daemon=True)
+        thread.start()
+
+        try:
+            yield
+        finally:
+            stopped.set()
+            thread.join()
+
+    def recover(self, requeue_all=False):
+        """
+        Re-queues jobs without a heartbeat for `JOB_HEARTBEAT_TIMEOUT` seconds:
+        running jobs whose worker crashed, and waiting jobs the backend lost.
+        With `requeue_all`, every waiting job is pushed again, eg. after
+        memcached restarted and lost its queue.
+        """
+
+        now = datetime.now()
+        lost = db.func.coalesce(Job.heartbeat_at, Job.started_at, Job.created_at) < now - timedelta(seconds=JOB_HEARTBEAT_TIMEOUT)
+
+        waiting = Job.query.filter(Job.status == JobStatus.queued)
+        if not requeue_all:
+            waiting = waiting.filter(lost)
+
+        jobs = Job.query.filter(Job.status == JobStatus.running, lost).all() + waiting.all()
+
+        for job in jobs:
+            job.status = JobStatus.queued
+            job.heartbeat_at = now
+
+        db.session.commit()
+
+        for job in sorted(jobs, key=lambda job: job.id):
+            self.backend.push(job.id)
+
+
+job_queue = JobQueue()
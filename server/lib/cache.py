@@ -0,0 +1,301 @@
+from collections import OrderedDict
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from typing import Callable, Optional
+from urllib.parse import parse_qs, urlparse
+from pymemcache.client.base import Client
+from .consts import COMPLETION_CACHE_MAX_BYTES, COMPLETION_CACHE_MAX_ENTRIES, COMPLETION_CACHE_TTL
+
+logger = logging.getLogger(__name__)
+
+
+class MemoryCache:
+    """
+    In-process LRU cache, evicting the least recently used entry once
+    `max_entries` is reached.
+    """
+
+    def __init__(self, ttl=COMPLETION_CACHE_TTL, max_entries=COMPLETION_CACHE_MAX_ENTRIES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[str]:
+        with self.lock:
+            if key not in self.entries:
+                return None
+
+            expires, value = self.entries[key]
+            if expires < time.time():
+                del self.entries[key]
+                return None
+
+            self.entries.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: str):
+        with self.lock:
+            self.entries[key] = (time.time() + self.ttl, value)
+            self.entries.move_to_end(key)
+
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+
+class DiskCache:
+    """
+    Cache stored as files in a directory, shared by processes on the same
+    machine. Evicts the oldest files once they total more than `max_bytes`.
+    """
+
+    def __init__(self, directory: str, ttl=COMPLETION_CACHE_TTL, max_bytes=COMPLETION_CACHE_MAX_BYTES):
+        self.directory = directory
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        os.makedirs(directory, exist_ok=True)
+
+    def path(self, key: str):
+        return os.path.join(self.directory, f"{key}.json")
+
+    def get(self, key: str) -> Optional[str]:
+        path = self.path(key)
+
+        try:
+            if os.path.getmtime(path) + self.ttl < time.time():
+                os.remove(path)
+                return None
+
+            with open(path) as f:
+                return f.read()
+        except OSError:
+            return None
+
+    def set(self, key: str, value: str):
+        # write to a temporary file first so readers never see partial entries
+        temporary_path = f"{self.path(key)}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(temporary_path, "w") as f:
+            f.write(value)
+        os.replace(temporary_path, self.path(key))
+
+        self.evict()
+
+    def evict(self):
+        entries = []
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith(".json"):
+                stat = entry.stat()
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+
+        total_bytes = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total_bytes <= self.max_bytes:
+                break
+
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+            total_bytes -= size
+
+
+class MemcachedCache:
+    """
+    Cache shared by every process using the memcached instance. Memcached
+    evicts least recently used entries when it runs out of memory.
+    """
+
+    def __init__(self, host: str, port: int, namespace="completion", ttl=COMPLETION_CACHE_TTL):
+        self.client = Client((host, port))
+        self.namespace = namespace
+        self.ttl = ttl
+
+    def get(self, key: str) -> Optional[str]:
+        value = self.client.get(f"quizicist:{self.namespace}:{key}")
+        return value.decode() if value is not None else None
+
+    def set(self, key: str, value: str):
+        self.client.set(f"quizicist:{self.namespace}:{key}", value.encode(), expire=int(self.ttl))
+
+
+def create_cache(uri: str, namespace="completion"):
+    """
+    Creates a cache backend from a URI, eg. `memory://?max_entries=100`,
+    `disk:///tmp/completions?max_bytes=1000000`, or
+    `memcached://localhost:11211?ttl=3600`. Keys in shared backends are
+    prefixed with `namespace`.
+    """
+
+    parsed = urlparse(uri)
+    options = { key: float(values[-1]) for key, values in parse_qs(parsed.query).items() }
+
+    if parsed.scheme == "memory":
+        if "max_entries" in options:
+            options["max_entries"] = int(options["max_entries"])
+
+        return MemoryCache(**options)
+
+    if parsed.scheme == "disk":
+        return DiskCache(parsed.path, **options)
+
+    if parsed.scheme == "memcached":
+        return MemcachedCache(parsed.hostname or "localhost", parsed.port or 11211, namespace, **options)
+
+    raise ValueError(f"Unsupported {namespace} cache URI: {uri}")
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls with the same key, so that only the first
+    caller runs and the rest wait for and share its result.
+    """
+
+    class Call:
+        def __init__(self):
+            self.done = threading.Event()
+            self.result = None
+            self.error = None
+
+    def __init__(self):
+        self.calls = {}
+        self.lock = threading.Lock()
+
+    def do(self, key: str, run: Callable):
+        with self.lock:
+            call = self.calls.get(key)
+            leader = call is None
+
+            if leader:
+                call = self.calls[key] = SingleFlight.Call()
+
+        if not leader:
+            call.done.wait()
+
+            if call.error:
+                raise call.error
+
+            return call.result
+
+        try:
+            call.result = run()
+            return call.result
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self.lock:
+                del self.calls[key]
+
+            call.done.set()
+
+
+class ConfiguredCache:
+    """
+    Cache whose backend is configured by URI with `config_key`. An
+    unavailable cache shouldn't fail requests, so backend errors are only
+    logged.
+    """
+
+    config_key = None
+    namespace = None
+
+    def __init__(self):
+        self.backend = create_cache(os.getenv(self.config_key, "memory://"), self.namespace)
+
+    def init_app(self, app):
+        if self.config_key in app.config:
+            self.backend = create_cache(app.config[self.config_key], self.namespace)
+
+    def read(self, key: str) -> Optional[str]:
+        try:
+            return self.backend.get(key)
+        except Exception:
+            logger.exception(f"Failed to read from {self.namespace} cache")
+            return None
+
+    def write(self, key: str, value: str):
+        try:
+            self.backend.set(key, value)
+        except Exception:
+            logger.exception(f"Failed to write to {self.namespace} cache")
+
+
+class CompletionCache(ConfiguredCache):
+    """
+    Caches processed completions by a hash of their prompt and sampling
+    parameters, and coalesces identical in-flight completions.
+
+    The backend is configured with `COMPLETION_CACHE_URI`.
+    """
+
+    config_key = "COMPLETION_CACHE_URI"
+    namespace = "completion"
+
+    def __init__(self):
+        super().__init__()
+        self.flights = SingleFlight()
+
+    @staticmethod
+    def key(params: dict) -> str:
+        encoded = json.dumps(params, sort_keys=True, separators=(",", ":"))
+        return hashlib.sha256(encoded.encode()).hexdigest()
+
+    def get_or_compute(self, params: dict, compute: Callable, bypass=False):
+        """
+        Returns the cached result for `params`, or calls `compute` and caches
+        its JSON-serializable result. With `bypass`, always calls `compute`,
+        replacing any cached result.
+        """
+
+        key = self.key(params)
+
+        def run():
+            if not bypass:
+                cached = self.read(key)
+
+                if cached is not None:
+                    logger.info(f"Completion cache hit: {key}")
+                    return json.loads(cached)
+
+            result = compute()
+            self.write(key, json.dumps(result))
+            return result
+
+        # calls bypassing the cache shouldn't share results with other calls
+        if bypass:
+            return run()
+
+        return self.flights.do(key, run)
+
+
+class GenerationCache(ConfiguredCache):
+    """
+    Caches serialized generations by representation, id, and revision.
+    Changes to a generation bump its revision, so outdated entries are never
+    read and expire on their own.
+
+    The backend is configured with `GENERATION_CACHE_URI`.
+    """
+
+    config_key = "GENERATION_CACHE_URI"
+    namespace = "generation"
+
+    def get_or_compute(self, generation_id: int, revision: int, compute: Callable[[], str], representation="json") -> str:
+        key = f"{representation}-{generation_id}-{revision}"
+
+        cached = self.read(key)
+        if cached is not None:
+            return cached
+
+        result = compute()
+        self.write(key, result)
+        return result
+
+
+completion_cache = CompletionCache()
+generation_cache = GenerationCache()
@@ -1,69 +1,297 @@
-from math import ceil
-from multiprocessing.dummy import Pool
+from functools import lru_cache
+from itertools import chain
+from math import ceil, sqrt
+from queue import Queue
 import openai
 import os
+import re
 from dotenv import load_dotenv
-from .consts import GPT_MODEL, MAX_CONTEXT_SIZE, ESTIMATED_QUESTION_SIZE, NUM_QUESTIONS
+from .cache import completion_cache
+from .consts import GPT_MODEL, NUM_QUESTIONS, MAX_SHARDS, MAX_CONCURRENT_COMPLETIONS, MAX_MODEL_CONTEXT_SIZE, \
+    QUESTION_TOKENS_MEAN, QUESTION_TOKENS_STDEV, QUESTION_TOKENS_HEADROOM
 from .errors import QuizicistError
+from .executor import completion_executor
+from .parsers.tokens import count_tokens, tokenize_components
 from .prompt import Prompt
-from .postprocess import postprocess_edit_mode, postprocess_manual
+from .postprocess import postprocess_questions, postprocess_manual, TemplateStream
+from .retry import RetryPolicy, retry
+from .throttle import openai_throttle, request_tokens
 
 # set up openai
 load_dotenv()
 openai.api_key = os.getenv("OPENAI_SECRET_KEY")
 
+# optionally use another OpenAI-compatible API, eg. experiments/server-tests/fake_openai.py
+openai.api_base = os.getenv("OPENAI_API_BASE", openai.api_base)
+
 # total number of tokens within a chapter
 def chapter_tokens(components):
     return sum(map(lambda c: c["tokens"], components))
 
 
-def shard_chapter(components):
-    total_tokens = chapter_tokens(components)
-    max_tokens = total_tokens / ceil(total_tokens / MAX_CONTEXT_SIZE)
+# tokens to allow for generating `num_questions` questions, from the mean and spread of observed question sizes
+def completion_budget(num_questions):
+    return ceil(num_questions * QUESTION_TOKENS_MEAN + QUESTION_TOKENS_HEADROOM * QUESTION_TOKENS_STDEV * sqrt(num_questions))
+
+
+# tokens in a shard's prompt besides the shard itself
+@lru_cache
+def prompt_overhead(num_questions):
+    return count_tokens([shard_prompt("", num_questions).prompt])[0]
+
+
+# largest shard whose prompt and completion for a full job fit in the model's context
+def max_shard_tokens():
+    return MAX_MODEL_CONTEXT_SIZE - prompt_overhead(NUM_QUESTIONS) - completion_budget(NUM_QUESTIONS)
+
+
+# `(prompt tokens, max_tokens)` for a prompt, never requesting more than fits in the model's context
+def prompt_budget(prompt: Prompt, num_questions):
+    prompt_tokens = prompt.token_count()
+    return prompt_tokens, max(1, min(completion_budget(num_questions), MAX_MODEL_CONTEXT_SIZE - prompt_tokens))
+
+
+# split text after sentence endings, or before words, keeping whitespace so pieces join back together
+SENTENCE_BOUNDARY = re.compile(r"(?<=[.!?])(?=\s)")
+WORD_BOUNDARY = re.compile(r"(?=\s)")
+
+
+def split_text(text, boundary):
+    return tokenize_components([piece for piece in boundary.split(text) if piece])
 
-    shards = []
-    num_tokens = 0
-    curr_prompt = ""
 
-    for component in components:
-        component_tokens = component["tokens"]
-        component_text = component["text"]
+# split a component which doesn't fit in a prompt at sentence boundaries,
+# falling back to word boundaries for sentences which still don't fit
+def split_component(component):
+    if component["tokens"] <= max_shard_tokens():
+        return [component]
 
-        if num_tokens < max_tokens and num_tokens + component_tokens < MAX_CONTEXT_SIZE:
-            curr_prompt += component_text
-            num_tokens += component_tokens
+    pieces = []
+    for sentence in split_text(component["text"], SENTENCE_BOUNDARY):
+        if sentence["tokens"] > max_shard_tokens():
+            pieces.extend(split_text(sentence["text"], WORD_BOUNDARY))
         else:
-            shards.append(curr_prompt)
+            pieces.append(sentence)
+
+    return pieces
+
+
+# group consecutive token counts into as few groups as possible without exceeding `capacity`
+def partition_tokens(tokens, capacity):
+    groups = [[]]
+    load = 0
+
+    for index, count in enumerate(tokens):
+        if groups[-1] and load + count > capacity:
+            groups.append([])
+            load = 0
+
+        groups[-1].append(index)
+        load += count
+
+    return groups
+
+
+# group components into shards which fit in a prompt
+# shards have the same `{"text", "tokens"}` schema as components
+def shard_chapter(components):
+    components = list(chain.from_iterable(map(split_component, components)))
+
+    # no shards for empty or whitespace-only content, which `plan_completion` rejects
+    if not any(component["text"].strip() for component in components):
+        return []
+
+    tokens = [component["tokens"] for component in components]
+
+    # fewest shards which fit in a prompt
+    max_tokens = max(max_shard_tokens(), max(tokens))
+    num_shards = len(partition_tokens(tokens, max_tokens))
 
-            curr_prompt = component_text
-            num_tokens = component_tokens
+    # binary search for the smallest largest shard with that many shards
+    low, high = max(tokens), max_tokens
+    while low < high:
+        capacity = (low + high) // 2
 
-    shards.append(curr_prompt)
-    return shards
+        if len(partition_tokens(tokens, capacity)) <= num_shards:
+            high = capacity
+        else:
+            low = capacity + 1
+
+    return [
+        {
+            "text": "".join(components[index]["text"] for index in group),
+            "tokens": sum(tokens[index] for index in group),
+        }
+        for group in partition_tokens(tokens, low)
+    ]
 
 
-def run_gpt3(shard, num_questions):
-    prompt = Prompt(num_questions=num_questions)\
+# prompt asking for questions about a shard
+def shard_prompt(shard, num_questions) -> Prompt:
+    return Prompt(num_questions=num_questions)\
         .add_text(shard, newlines=0)\
         .add_introduction()\
         .add_template()\
         .add_instructions()
 
-    # process question until 5 well-formatted questions have been generated
-    # TODO: add tally for failed generations and quit after n
-    while True:
-        print(f"Running completion on shard...")
-        completion = "Question:" + openai.Completion.create(
-            engine=GPT_MODEL,
-            prompt=prompt.prompt,
-            max_tokens=NUM_QUESTIONS * ESTIMATED_QUESTION_SIZE,
-            temperature=0.8,
-        )["choices"][0]["text"]
 
-        processed = postprocess_edit_mode(completion, num_questions)
+# completion parameters for a batch of jobs, which also key their cached questions
+def completion_params(shard, counts):
+    return {
+        "engine": GPT_MODEL,
+        "prompt": shard_prompt(shard, max(counts)).prompt,
+        "max_tokens": completion_budget(max(counts)),
+        "temperature": 0.8,
+    }
+
+
+def run_gpt3(shard, counts, policy: RetryPolicy = None, use_cache=True):
+    """
+    Generates questions about a shard for a batch of jobs, sending the shard's
+    prompt once and sampling one choice per job with `n`. `counts` is the
+    number of questions for each job, returns a list of questions per job.
+    """
+
+    params = completion_params(shard, counts)
+
+    def generate():
+        batch = [[] for _ in counts]
+
+        def attempt(timeout):
+            # keep well-formed questions from earlier attempts, only requesting the rest
+            missing = incomplete_jobs(batch, counts)
+            num_questions = max(counts[index] - len(batch[index]) for index in missing)
+            prompt = shard_prompt(shard, num_questions)
+
+            prompt_tokens, max_tokens = prompt_budget(prompt, num_questions)
+            with openai_throttle.acquire(request_tokens(prompt_tokens, max_tokens, len(missing)), timeout) as timeout:
+                print(f"Running completion for {len(missing)}x{num_questions} questions on shard...")
+                choices = openai.Completion.create(
+                    **dict(params, prompt=prompt.prompt, max_tokens=max_tokens),
+                    n=len(missing),
+                    request_timeout=timeout,
+                )["choices"]
+
+            for choice in choices:
+                index = missing[choice["index"]]
+                completion = "Question:" + choice["text"]
+                parsed = postprocess_questions(completion, num_questions, truncated=is_truncated(choice))
+                collect_batch_questions(batch, index, parsed, counts[index])
+
+            return batch if not incomplete_jobs(batch, counts) else False
+
+        # process question until well-formatted questions have been generated
+        return retry(attempt, policy or RetryPolicy(), f"Completion of {counts} questions").value
+
+    # reuse questions generated for identical prompts
+    return completion_cache.get_or_compute(
+        { **params, "num_questions": counts },
+        generate,
+        bypass=not use_cache,
+    )
+
+
+# stream completions for a batch of jobs, calling `on_question` with the
+# job's position in the batch and each question as soon as it's parsed
+def stream_gpt3(shard, counts, on_question, policy: RetryPolicy = None, use_cache=True):
+    streamed = []
+
+    def generate():
+        streamed.append(True)
+        return stream_batch(shard, counts, on_question, policy)
+
+    # questions generated for identical prompts, by `run_gpt3` or another stream, are sent all at once
+    batch = completion_cache.get_or_compute(
+        { **completion_params(shard, counts), "num_questions": counts },
+        generate,
+        bypass=not use_cache,
+    )
+
+    if not streamed:
+        for index, questions in enumerate(batch):
+            for question in questions:
+                on_question(index, question)
+
+    return batch
+
+
+def stream_batch(shard, counts, on_question, policy: RetryPolicy = None):
+    batch = [[] for _ in counts]
+
+    def attempt(timeout):
+        missing = incomplete_jobs(batch, counts)
+        num_questions = max(counts[index] - len(batch[index]) for index in missing)
+        prompt = shard_prompt(shard, num_questions)
+
+        prompt_tokens, max_tokens = prompt_budget(prompt, num_questions)
+        with openai_throttle.acquire(request_tokens(prompt_tokens, max_tokens, len(missing)), timeout) as timeout:
+            print(f"Streaming completion for {len(missing)}x{num_questions} questions on shard...")
+            stream = openai.Completion.create(
+                engine=GPT_MODEL,
+                prompt=prompt.prompt,
+                max_tokens=max_tokens,
+                temperature=0.8,
+                n=len(missing),
+                request_timeout=timeout,
+                stream=True,
+            )
+
+            # choices are interleaved in the stream, so each is parsed separately
+            parsers = [TemplateStream() for _ in missing]
+            for parser in parsers:
+                parser.feed("Question:")
+
+            def add(index, parsed):
+                for question in collect_batch_questions(batch, index, parsed, counts[index]):
+                    on_question(index, question)
 
-        if processed:
-            return processed
+            truncated = set()
+            for event in stream:
+                for choice in event["choices"]:
+                    add(missing[choice["index"]], parsers[choice["index"]].feed(choice["text"]))
+
+                    if is_truncated(choice):
+                        truncated.add(choice["index"])
+
+            for position, parser in enumerate(parsers):
+                add(missing[position], parser.close(truncated=position in truncated))
+
+        return batch if not incomplete_jobs(batch, counts) else False
+
+    return retry(attempt, policy or RetryPolicy(), f"Streamed completion of {counts} questions").value
+
+
+# whether a completion choice was cut off by `max_tokens`, its last question may be incomplete
+def is_truncated(choice):
+    return choice.get("finish_reason") == "length"
+
+
+# add parsed questions which weren't asked in earlier attempts, up to `num_questions`
+def collect_questions(questions, parsed, num_questions):
+    asked = set(question["question"] for question in questions)
+    added = []
+
+    for question in parsed:
+        if len(questions) == num_questions:
+            break
+
+        if question["question"] not in asked:
+            questions.append(question)
+            added.append(question)
+            asked.add(question["question"])
+
+    return added
+
+
+# add parsed questions to one job of a batch, skipping questions asked by any job in the batch
+def collect_batch_questions(batch, index, parsed, num_questions):
+    asked = set(question["question"] for questions in batch for question in questions)
+    return collect_questions(batch[index], [q for q in parsed if q["question"] not in asked], num_questions)
+
+
+# positions of batched jobs which still need questions
+def incomplete_jobs(batch, counts):
+    return [index for index, count in enumerate(counts) if len(batch[index]) < count]
 
 
 # divide quiz questions evenly by shard
@@ -91,47 +319,134 @@ def divide_questions(shards, num_questions):
 
     return jobs
 
-def complete(file_content, parser, num_questions):
-    components = parser(file_content)
-    shards = shard_chapter(components)
-    jobs = divide_questions(shards, num_questions)
+# pick evenly spaced shards when there are more shards than questions,
+# so questions cover the whole document instead of only its start
+def spread_shards(num_shards, num_questions):
+    if num_questions >= num_shards:
+        return list(range(num_shards))
+
+    return [(2 * index + 1) * num_shards // (2 * num_questions) for index in range(num_questions)]
+
+
+# schedule completion jobs for each shard
+# jobs are `(shard index, number of questions)` pairs
+def plan_completion(shards, num_questions, long_document=False):
+    if not shards:
+        raise QuizicistError("Your uploaded content is empty. Please add some text and try again.")
+
+    # limit content size, unless uploaded as a long document
+    if len(shards) > MAX_SHARDS and not long_document:
+        raise QuizicistError("Your uploaded content is too long. Please shorten the prompt or upload it as a long document and try again.")
+
+    return divide_questions(spread_shards(len(shards), num_questions), num_questions)
+
+
+# group jobs by shard, so that each shard's prompt is only sent once
+# batches are `(shard index, job indices)` pairs
+def batch_jobs(jobs):
+    batches = {}
+    for index, (shard, _) in enumerate(jobs):
+        batches.setdefault(shard, []).append(index)
+
+    return list(batches.items())
 
-    # limit content size to three shards
-    if len(shards) > 3:
-        raise QuizicistError("Your uploaded content is too long. Please shorten the prompt and try again.")
 
-    # parallelize GPT-3 calls
-    with Pool(len(jobs)) as pool:
-        return pool.starmap(run_gpt3, jobs)
+def batch_runner(shards, jobs, policy: RetryPolicy = None, use_cache=True):
+    def run_batch(batch):
+        shard, indices = batch
+        counts = [jobs[index][1] for index in indices]
+        return list(zip(indices, run_gpt3(shards[shard], counts, policy, use_cache)))
 
+    return run_batch
 
-def add_answer_choices(file_content, parser, question):
+
+# parallelize GPT-3 calls, yielding `(job index, questions)` as each batch finishes
+def run_jobs(shards, jobs, policy: RetryPolicy = None, use_cache=True):
+    # bound concurrent completions, long documents can have many shards
+    run_batch = batch_runner(shards, jobs, policy, use_cache)
+    for results in completion_executor.map_unordered(run_batch, batch_jobs(jobs), MAX_CONCURRENT_COMPLETIONS):
+        yield from results
+
+
+# `run_jobs` for async callers
+async def arun_jobs(shards, jobs, policy: RetryPolicy = None, use_cache=True):
+    run_batch = batch_runner(shards, jobs, policy, use_cache)
+    async for results in completion_executor.amap_unordered(run_batch, batch_jobs(jobs), MAX_CONCURRENT_COMPLETIONS):
+        for result in results:
+            yield result
+
+
+def stream_jobs(shards, jobs, policy: RetryPolicy = None, use_cache=True):
+    """
+    Streams completion jobs in parallel, yielding `(event, job index, value)`
+    tuples: a "question" event for each question as soon as it's parsed, then
+    a "complete" or "error" event when each job finishes.
+    """
+
+    events = Queue()
+
+    def run_batch(batch):
+        shard, indices = batch
+        counts = [jobs[index][1] for index in indices]
+        on_question = lambda position, question: events.put(("question", indices[position], question))
+
+        try:
+            stream_gpt3(shards[shard], counts, on_question, policy, use_cache)
+            for index in indices:
+                events.put(("complete", index, None))
+        except Exception as e:
+            for index in indices:
+                events.put(("error", index, e))
+
+    completion_executor.start(run_batch, batch_jobs(jobs), MAX_CONCURRENT_COMPLETIONS)
+
+    finished = 0
+    while finished < len(jobs):
+        event = events.get()
+
+        if event[0] != "question":
+            finished += 1
+
+        yield event
+
+
+def complete(file_content, parser, num_questions, policy: RetryPolicy = None, use_cache=True):
     components = parser(file_content)
-    shard = shard_chapter(components)[question.shard]
+    shards = [shard["text"] for shard in shard_chapter(components)]
+    jobs = plan_completion(shards, num_questions)
+
+    # order generated questions by job
+    completed = [None] * len(jobs)
+    for index, questions in run_jobs(shards, jobs, policy, use_cache):
+        completed[index] = questions
 
+    return completed
+
+
+def add_answer_choices(shard, question, policy: RetryPolicy = None):
     # partial prompt starting at "Correct answer:"
     question_prompt = Prompt().add_question(question.question)
 
     # full prompt, appending partial prompt
-    prompt = Prompt(num_questions=1)\
-        .add_text(shard, newlines=0)\
-        .add_introduction()\
-        .add_template()\
-        .add_instructions()\
-        .join(question_prompt)
-
-    # TODO: clean up this loop or consolidate parsing into a single function
-    while True:
-        print("Running completion for custom question...")
-        completion = question_prompt.prompt + openai.Completion.create(
-            engine=GPT_MODEL,
-            prompt=prompt.prompt,
-            max_tokens=NUM_QUESTIONS * ESTIMATED_QUESTION_SIZE,
-            temperature=0.8,
-        )["choices"][0]["text"]
-
-        processed = postprocess_manual(completion, question.shard)
-        if processed:
-            return processed
-
-        print(f"Failed to parse the following:\n{completion}")
+    prompt = shard_prompt(shard, 1).join(question_prompt)
+
+    def attempt(timeout):
+        # only answer choices for a single question are generated
+        prompt_tokens, max_tokens = prompt_budget(prompt, 1)
+        with openai_throttle.acquire(request_tokens(prompt_tokens, max_tokens), timeout) as timeout:
+            print("Running completion for custom question...")
+            choice = openai.Completion.create(
+                engine=GPT_MODEL,
+                prompt=prompt.prompt,
+                max_tokens=max_tokens,
+                temperature=0.8,
+                request_timeout=timeout,
+            )["choices"][0]
+
+        # the last answer choice of a cut off completion may be incomplete
+        if is_truncated(choice):
+            return False
+
+        return postprocess_manual(question_prompt.prompt + choice["text"], question.shard)
+
+    return retry(attempt, policy or RetryPolicy(), "Completion of custom question").value
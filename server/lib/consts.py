@@ -11,17 +11,82 @@ TOP_LEVEL_COMPONENTS = [
     "List"
 ]
 
+# maximum characters of Rust Book listings kept in memory by the Markdown parser
+LISTING_CACHE_MAX_CHARS = 16 * 1024 * 1024
+
+# tokens in each component of plain text uploads, coalescing paragraphs up to this size
+TEXT_COMPONENT_TOKENS = 256
+
 # number of questions to generate per shard
 NUM_QUESTIONS = 5
 
-# maximum tokens allowed in DaVinci-2 model prompt
-MAX_MODEL_PROMPT_SIZE = 4000
+# maximum completions requested before giving up on malformed or failed output
+MAX_COMPLETION_ATTEMPTS = 4
+
+# seconds to wait before retrying a completion, doubling per retry up to the max
+RETRY_BASE_DELAY = 1
+RETRY_MAX_DELAY = 16
+
+# seconds allowed for a completion including retries, below gunicorn's 180s timeout
+COMPLETION_DEADLINE = 150
+
+# most OpenAI requests in flight at once, across all workers
+MAX_OPENAI_REQUESTS = 8
+
+# most OpenAI tokens (prompt and completion) requested per minute, across all workers
+OPENAI_TOKENS_PER_MINUTE = 250000
+
+# seconds a request waits for OpenAI capacity before giving up
+OPENAI_THROTTLE_MAX_WAIT = 60
+
+# seconds before a held request slot expires, in case its worker died
+OPENAI_SLOT_LEASE = COMPLETION_DEADLINE + 30
+
+# seconds before cached completions expire
+COMPLETION_CACHE_TTL = 7 * 24 * 60 * 60
+
+# maximum completions kept by the in-memory cache
+COMPLETION_CACHE_MAX_ENTRIES = 1024
+
+# maximum size of the on-disk cache
+COMPLETION_CACHE_MAX_BYTES = 256 * 1024 * 1024
 
-# estimated number of tokens generated from a single MCQ
-ESTIMATED_QUESTION_SIZE = 90
+# convert completions to JSON with the Edit API when they can't be parsed locally
+EDIT_MODE_FALLBACK = True
 
-# assuming generating 5 questions per shard, largest context possible
-MAX_CONTEXT_SIZE = MAX_MODEL_PROMPT_SIZE - NUM_QUESTIONS * ESTIMATED_QUESTION_SIZE
+# maximum tokens in the model's context, shared by the prompt and completion
+MAX_MODEL_CONTEXT_SIZE = 4097
+
+# tokens per generated question in the template format,
+# measured by experiments/token-budget/question_tokens.py
+QUESTION_TOKENS_MEAN = 86
+QUESTION_TOKENS_STDEV = 30
+
+# standard deviations of headroom in `max_tokens`, about the 99th percentile for a single question
+# questions cut off by the limit are dropped and requested again, see `postprocess_questions`
+QUESTION_TOKENS_HEADROOM = 2.5
+
+# seconds between heartbeats from a worker running a job
+JOB_HEARTBEAT_INTERVAL = 30
+
+# seconds without a heartbeat before a job is assumed lost, eg. with a crashed worker, and queued again
+JOB_HEARTBEAT_TIMEOUT = 5 * 60
+
+# seconds between checks for lost jobs by each worker
+JOB_RECOVER_INTERVAL = 60
+
+# generations listed per page, by default and at most
+GENERATIONS_PAGE_SIZE = 20
+MAX_GENERATIONS_PAGE_SIZE = 100
+
+# most shards allowed in an upload, unless it's a long document
+MAX_SHARDS = 3
+
+# most completions run at once for a single generation
+MAX_CONCURRENT_COMPLETIONS = 4
+
+# threads shared by every request when completions don't run on greenlets
+COMPLETION_POOL_SIZE = 16
 
 # feedback options for answer choices
 class FeedbackTypes(enum.IntEnum):
@@ -40,3 +105,15 @@ class ExportTypes(enum.IntEnum):
     google_forms = 0
     mdbook = 1
     plain_text = 2
+
+# background generation job kinds
+class JobTypes(enum.IntEnum):
+    upload = 0
+    more = 1
+
+# lifecycle of background generation jobs and their shards
+class JobStatus(enum.IntEnum):
+    queued = 0
+    running = 1
+    complete = 2
+    failed = 3
@@ -1,3 +1,29 @@
+import openai.error as OpenAIError
+
+
 # custom exception class for API errors
 class QuizicistError(Exception):
     pass
+
+
+# user-facing messages for errors raised by the OpenAI API
+OPENAI_ERROR_MESSAGES = {
+    OpenAIError.ServiceUnavailableError: "OpenAI is experiencing server issues. Please wait a few minutes and try again.",
+    OpenAIError.RateLimitError: "We're currently experiencing high demand. Please wait a few minutes and try again.",
+    OpenAIError.Timeout: "OpenAI took too long to respond. Please try again. If the error is not resolved, please submit feedback detailing your error.",
+}
+
+
+def error_message(e: Exception) -> str:
+    """
+    Returns a message describing an error raised while generating questions.
+    """
+
+    if isinstance(e, QuizicistError):
+        return str(e)
+
+    for error_type, message in OPENAI_ERROR_MESSAGES.items():
+        if isinstance(e, error_type):
+            return message
+
+    return "Something went wrong while generating questions. Please try again."
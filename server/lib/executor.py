@@ -0,0 +1,154 @@
+import asyncio
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from itertools import islice
+import logging
+import threading
+from typing import AsyncIterator, Callable, Iterable, Iterator
+from .consts import COMPLETION_POOL_SIZE
+
+# gevent is only used when running in a gevent worker
+try:
+    import gevent
+    import gevent.pool
+    from gevent import monkey
+except ImportError:
+    gevent = None
+
+logger = logging.getLogger(__name__)
+
+# thread pool shared by every request, created on first use
+_thread_pool = None
+_thread_pool_lock = threading.Lock()
+
+
+def shared_thread_pool() -> ThreadPoolExecutor:
+    global _thread_pool
+
+    with _thread_pool_lock:
+        if _thread_pool is None:
+            _thread_pool = ThreadPoolExecutor(COMPLETION_POOL_SIZE, thread_name_prefix="completion")
+
+    return _thread_pool
+
+
+class ThreadExecutor:
+    """
+    Runs calls in a long-lived thread pool shared by every request, instead
+    of creating a pool per request.
+    """
+
+    def map_unordered(self, fn: Callable, items: Iterable, max_workers: int) -> Iterator:
+        pool = shared_thread_pool()
+        items = iter(items)
+
+        # submit more items as earlier ones finish, running at most `max_workers` at once
+        pending = set(pool.submit(fn, item) for item in islice(items, max_workers))
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+
+            for future in done:
+                pending.update(pool.submit(fn, item) for item in islice(items, 1))
+                yield future.result()
+
+    def start(self, fn: Callable, items: Iterable, max_workers: int):
+        # drive the calls from a separate thread, so they don't hold a slot in the shared pool
+        threading.Thread(target=lambda: list(self.map_unordered(fn, items, max_workers)), daemon=True).start()
+
+
+class GeventExecutor:
+    """
+    Runs calls on greenlets, for gevent workers with monkey-patched I/O.
+    """
+
+    def map_unordered(self, fn: Callable, items: Iterable, max_workers: int) -> Iterator:
+        return gevent.pool.Pool(max_workers).imap_unordered(fn, items)
+
+    def start(self, fn: Callable, items: Iterable, max_workers: int):
+        gevent.spawn(lambda: list(self.map_unordered(fn, items, max_workers)))
+
+
+class AsyncioExecutor:
+    """
+    Runs blocking calls in the shared thread pool from a running event loop,
+    for async callers.
+    """
+
+    async def map_unordered(self, fn: Callable, items: Iterable, max_workers: int) -> AsyncIterator:
+        loop = asyncio.get_running_loop()
+        semaphore = asyncio.Semaphore(max_workers)
+
+        async def run(item):
+            async with semaphore:
+                return await loop.run_in_executor(shared_thread_pool(), fn, item)
+
+        for result in asyncio.as_completed([run(item) for item in items]):
+            yield await result
+
+
+def gevent_patched():
+    return gevent is not None and monkey.is_module_patched("socket")
+
+
+def create_executor(name: str):
+    """
+    Creates an executor by name: "gevent", "threads", or "auto", which uses
+    greenlets when sockets are monkey-patched by gevent and threads otherwise.
+    """
+
+    if name == "auto":
+        name = "gevent" if gevent_patched() else "threads"
+
+    if name == "gevent":
+        if not gevent_patched():
+            logger.warning("Using the gevent executor without monkey-patching, completions won't run concurrently")
+
+        return GeventExecutor()
+
+    if name == "threads":
+        return ThreadExecutor()
+
+    raise ValueError(f"Unsupported completion executor: {name}")
+
+
+class CompletionExecutor:
+    """
+    Fans out completions with the configured executor (`COMPLETION_EXECUTOR`).
+    Async callers use `amap_unordered` instead.
+    """
+
+    def __init__(self):
+        self.name = "auto"
+        self.executor = None
+
+    def init_app(self, app):
+        self.name = app.config["COMPLETION_EXECUTOR"]
+        self.executor = None
+
+    def get_executor(self):
+        # created on first use, after gevent workers have patched I/O
+        if self.executor is None:
+            self.executor = create_executor(self.name)
+
+        return self.executor
+
+    def map_unordered(self, fn: Callable, items: Iterable, max_workers: int) -> Iterator:
+        """
+        Calls `fn` on each item with at most `max_workers` calls at once,
+        yielding results as they finish.
+        """
+
+        return self.get_executor().map_unordered(fn, items, max_workers)
+
+    def start(self, fn: Callable, items: Iterable, max_workers: int):
+        """
+        Calls `fn` on each item in the background, with at most `max_workers`
+        calls at once.
+        """
+
+        self.get_executor().start(fn, items, max_workers)
+
+    def amap_unordered(self, fn: Callable, items: Iterable, max_workers: int) -> AsyncIterator:
+        return AsyncioExecutor().map_unordered(fn, items, max_workers)
+
+
+completion_executor = CompletionExecutor()
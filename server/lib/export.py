@@ -58,8 +58,7 @@ class GoogleFormExport:
 
 
     def question_to_json(self, question: Question):
-        # remove deleted answers
-        answers = list(filter(lambda choice: not choice.deleted, question.answers))
+        answers = question.undeleted_answers
 
         incorrect = [choice for choice in answers if choice.user_feedback == FeedbackTypes.incorrect]
         correct = [choice for choice in answers if choice.user_feedback == FeedbackTypes.correct]
@@ -114,10 +113,9 @@ class GoogleFormExport:
         self.make_form_quiz(form_id)
 
         # add each question to form
-        for question in generation.questions[::-1]:
-            if not question.deleted:
-                question_update = self.build_question_update(question)
-                self.form_service.forms().batchUpdate(formId=form_id, body=question_update).execute()
+        for question in generation.undeleted_questions[::-1]:
+            question_update = self.build_question_update(question)
+            self.form_service.forms().batchUpdate(formId=form_id, body=question_update).execute()
         
         return form_id
 
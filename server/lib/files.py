@@ -1,15 +1,47 @@
 from typing import Tuple
 from flask import request, current_app
+import gzip
+import hashlib
 import os
 import re
-import uuid
-from werkzeug.utils import secure_filename
+import threading
+
+
+def content_path(content_hash: str) -> str:
+    return os.path.join(current_app.config["UPLOAD_FOLDER"], f"{content_hash}.gz")
+
+
+def store_content(content: str) -> str:
+    """
+    Stores uploaded content compressed under its SHA-256 hash, writing each
+    distinct upload only once.
+
+    Returns the content hash.
+    """
+
+    content_hash = hashlib.sha256(content.encode()).hexdigest()
+    path = content_path(content_hash)
+
+    if not os.path.exists(path):
+        # write to a temporary file first so concurrent uploads never read partial content
+        temporary_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with gzip.open(temporary_path, "wt", encoding="utf-8") as f:
+            f.write(content)
+
+        os.replace(temporary_path, path)
+
+    return content_hash
+
+
+def open_content(content_hash: str):
+    return gzip.open(content_path(content_hash), "rt", encoding="utf-8")
+
 
 def handle_file_upload() -> Tuple[str, str]:
     """
-    Saves an uploaded file to disk with a unique filename.
+    Saves an uploaded file to disk by content hash.
     
-    Returns a tuple with the original filename and unique filename.
+    Returns a tuple with the original filename and content hash.
     """
 
     if "file" not in request.files:
@@ -24,17 +56,16 @@ def handle_file_upload() -> Tuple[str, str]:
 
     # save file to disk
     filename = file.filename
-    unique_filename = secure_filename(f"{uuid.uuid4().hex}-{filename}")
+    content_hash = store_content(file.read().decode())
 
-    upload_path = os.path.join(current_app.config['UPLOAD_FOLDER'], unique_filename)
-    file.save(upload_path)
-
-    return (filename, unique_filename)
+    return (filename, content_hash)
 
 
 def create_file_from_json() -> Tuple[str, str]:
     """
     Saves plain-text content uploaded as JSON to disk as markdown.
+
+    Returns a tuple with the title and content hash.
     """
     
     title = request.json["title"]
@@ -53,9 +84,7 @@ def create_file_from_json() -> Tuple[str, str]:
         escape_chars = r'_*[]()~`>#+-=|{}.!'
         content = re.sub(f'([{re.escape(escape_chars)}])', r'\\\1', content)
 
-    unique_filename = secure_filename(f"{uuid.uuid4().hex}-{title}.md")
-    upload_path = os.path.join(current_app.config['UPLOAD_FOLDER'], unique_filename)
-    with open(upload_path, "w+") as f:
-        f.write(content)
+    # identical content is stored once, shared by every upload of it
+    content_hash = store_content(content)
 
-    return (title, unique_filename)
+    return (title, content_hash)
@@ -4,7 +4,7 @@ from models import Question
 from lib.consts import FeedbackTypes
 
 def get_answer_by_feedback(question: Question, feedback: FeedbackTypes):
-    return [choice.text for choice in question.answers if choice.user_feedback == feedback]
+    return [choice.text for choice in question.undeleted_answers if choice.user_feedback == feedback]
 
 def serialize_question(question: Question):
     incorrect = get_answer_by_feedback(question, FeedbackTypes.incorrect)
@@ -20,10 +20,8 @@ def serialize_question(question: Question):
     }
 
 
+# serialize undeleted questions, see `Generation.undeleted_questions`
 def questions_to_toml(questions: List[Question]):
-    # remove deleted questions
-    questions = filter(lambda question: not question.deleted, questions)
-
     # remove questions without one correct answer
     questions = filter(lambda question: len(get_answer_by_feedback(question, FeedbackTypes.correct)) == 1, questions)
 
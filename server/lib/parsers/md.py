@@ -1,22 +1,232 @@
+from collections import OrderedDict
 from dotenv import load_dotenv
+from html.parser import HTMLParser
 import os
-import json
 import re
-import mistletoe
+import threading
+from mistletoe import Document
 from mistletoe.ast_renderer import ASTRenderer
-from bs4 import BeautifulSoup
-from transformers import GPT2Tokenizer
-from ..consts import TOP_LEVEL_COMPONENTS
+from .tokens import tokenize_components
+from ..consts import LISTING_CACHE_MAX_CHARS, TOP_LEVEL_COMPONENTS
 
 # required to resolve code listings
 load_dotenv()
 BOOK_DIR = os.path.join(os.getenv("RUST_BOOK_PATH"), "src")
 
-tokenizer = GPT2Tokenizer.from_pretrained("gpt2")
+# whitespace, comments, and declarations before any content, which lxml skips
+LEADING_BLANKS = re.compile(r"^(?:[ \t\n\r\f]+|<!--.*?-->|<![A-Za-z][^>]*>|<\?[^>]*>)+", re.DOTALL)
+
+# whitespace characters in html
+WHITESPACE = " \t\n\r\f"
+
+
+class TextExtractor(HTMLParser):
+    """
+    Collects the text of an HTML fragment the way BeautifulSoup's `.text`
+    does with lxml: tags, comments, and script and style contents are
+    dropped, character references are decoded, and whitespace-only text
+    between tags collapses to a single newline or space.
+    """
+
+    PRESERVE_WHITESPACE = ("pre", "textarea")
+    SKIP_CONTENT = ("script", "style")
+    VOID_ELEMENTS = ("area", "base", "br", "col", "embed", "hr", "img", "input", "link", "meta", "param", "source", "track", "wbr")
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.text = []
+        self.data = []
+        self.open = []
+
+        # whether any content or tags have been seen, before which whitespace is kept separately
+        self.started = False
+
+        # depth of open tags which preserve whitespace or hide their content
+        self.preserve = 0
+        self.skip = 0
+
+    def flush(self):
+        data = "".join(self.data)
+        self.data = []
+
+        if not data or self.skip:
+            return
+
+        # lxml splits whitespace following stray end tags at the start from the content after it
+        if not self.started:
+            content = data.lstrip(WHITESPACE)
+            if content and content != data:
+                self.text.append("\n" if "\n" in data[:-len(content)] else " ")
+                data = content
+
+            self.started = bool(content)
+
+        if not self.preserve and data.strip(WHITESPACE) == "":
+            data = "\n" if "\n" in data else " "
+
+        self.text.append(data)
+
+    def handle_data(self, data):
+        self.data.append(data)
+
+    def handle_starttag(self, tag, attrs):
+        self.flush()
+        self.started = self.started or tag not in self.SKIP_CONTENT
+        if tag not in self.VOID_ELEMENTS:
+            self.open.append(tag)
+
+        self.preserve += tag in self.PRESERVE_WHITESPACE
+        self.skip += tag in self.SKIP_CONTENT
+
+    def handle_endtag(self, tag):
+        # lxml drops end tags without an open element, joining the text around them
+        if tag not in self.open:
+            return
+
+        self.flush()
+        while self.open.pop() != tag:
+            pass
+
+        if tag in self.PRESERVE_WHITESPACE:
+            self.preserve = max(self.preserve - 1, 0)
+        if tag in self.SKIP_CONTENT:
+            self.skip = max(self.skip - 1, 0)
+
+    def handle_startendtag(self, tag, attrs):
+        self.flush()
+        self.started = True
+
+    def handle_comment(self, data):
+        self.flush()
+
+    def handle_decl(self, decl):
+        self.flush()
+
+    def handle_pi(self, data):
+        self.flush()
+
+    def unknown_decl(self, data):
+        self.flush()
+
 
 # clean tags from html within markdown, returning only text
 def clean_html(text):
-    return BeautifulSoup(text, "lxml").text
+    # like lxml, normalize newlines and skip leading whitespace
+    text = LEADING_BLANKS.sub("", text.replace("\r\n", "\n").replace("\r", "\n"))
+
+    extractor = TextExtractor()
+    extractor.feed(text)
+    extractor.close()
+    extractor.flush()
+
+    return "".join(extractor.text)
+
+
+# anchor comments marking sections of listings, eg. `// ANCHOR: here` and `// ANCHOR_END: here`
+ANCHOR_START = re.compile(r"ANCHOR:\s*([\w-]+)")
+ANCHOR_END = re.compile(r"ANCHOR_END:\s*([\w-]+)")
+
+# line selectors in includes: `2`, `2:10`, `:10`, or `2:`
+LINE_RANGE = re.compile(r"(\d*)(?:(:)(\d*))?")
+
+
+def anchored_lines(lines, anchor):
+    selected = []
+    inside = False
+
+    for line in lines:
+        if inside:
+            end = ANCHOR_END.search(line)
+            if end and end.group(1) == anchor:
+                break
+
+            selected.append(line)
+
+        else:
+            start = ANCHOR_START.search(line)
+            inside = start is not None and start.group(1) == anchor
+
+    return selected
+
+
+def select_lines(content, selector):
+    """
+    Selects the part of a listing named by an include's selector, following
+    mdBook: a line number, a range of lines, or an anchor. Anchor comments
+    are removed, as they aren't shown in the book.
+    """
+
+    lines = content.splitlines()
+    line_range = LINE_RANGE.fullmatch(selector)
+
+    if not selector:
+        pass
+
+    elif line_range is None:
+        lines = anchored_lines(lines, selector)
+
+    else:
+        first, is_range, last = line_range.groups()
+        start = max(int(first or 1) - 1, 0)
+
+        if is_range:
+            lines = lines[start:int(last) if last else None]
+        else:
+            lines = lines[start:start + 1]
+
+    lines = [line for line in lines if not ANCHOR_START.search(line) and not ANCHOR_END.search(line)]
+    return "".join(f"{line}\n" for line in lines)
+
+
+class ListingCache:
+    """
+    Keeps resolved listings in memory, evicting the least recently used once
+    they total more than `max_chars`. Entries are checked against the file's
+    modification time and size, so edited listings are read again.
+    """
+
+    def __init__(self, max_chars=LISTING_CACHE_MAX_CHARS):
+        self.max_chars = max_chars
+        self.size = 0
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, path, selector):
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+
+        key = (path, selector)
+        version = (stat.st_mtime_ns, stat.st_size)
+
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and entry[0] == version:
+                self.entries.move_to_end(key)
+                return entry[1]
+
+        try:
+            with open(path) as f:
+                content = select_lines(f.read(), selector)
+        except OSError:
+            return None
+
+        with self.lock:
+            if key in self.entries:
+                self.size -= len(self.entries.pop(key)[1])
+
+            self.entries[key] = (version, content)
+            self.size += len(content)
+
+            while self.size > self.max_chars:
+                _, (_, evicted) = self.entries.popitem(last=False)
+                self.size -= len(evicted)
+
+        return content
+
+
+listing_cache = ListingCache()
 
 
 # load file content from included listings
@@ -35,70 +245,56 @@ def resolve_include(match):
         
         return ""
 
-    # get filename after "{{#<include type>" and remove trailing "}}"
-    filename = text.split(" ")
+    # get include type and path after "{{#", eg. {{#rustdoc_include ../listings/main.rs:here}}
+    directive = re.match(r"{{#(\S+)\s+(.*?)\s*}}", text)
 
-    if "include" not in filename[0]:
+    if directive is None or "include" not in directive.group(1):
         return ""
 
-    # remove anchor on path
-    split_filename = filename[1].split(":")
-    if len(split_filename) > 1:
-        listing_path = split_filename[0]
-    else:
-        listing_path = filename[1][:-2]
-
+    # split anchor or line range from path
+    listing_path, _, selector = directive.group(2).partition(":")
     listing_path = os.path.join(BOOK_DIR, listing_path)
 
     # handle files not found in Rust Book listings
-    try:
-        with open(listing_path) as f:
-            return f.read()
-    except OSError:
-        return ""
+    return listing_cache.get(listing_path, selector) or ""
 
 
 # recurse over MD AST, extracting raw text from inline elements
 def find_component_text(component):
     text = []
 
-    for child in component["children"]:
-        if child["type"] == "RawText":
+    for child in component.children:
+        if type(child).__name__ == "RawText":
             # add content to component text, replacing includes with relevant content
-            text.append(re.sub(r'{{(.*?)}}', resolve_include, child["content"]))
+            text.append(re.sub(r'{{(.*?)}}', resolve_include, child.content))
 
-        elif child["type"] == "LineBreak":
+        elif type(child).__name__ == "LineBreak":
             text.append(" ")
 
-        elif "children" in child:
-            text.append(find_component_text(child))
+        elif hasattr(child, "children"):
+            # html is stripped once per component, but nested text still
+            # drops leading whitespace as when each level was cleaned separately
+            text.append(LEADING_BLANKS.sub("", find_component_text(child)))
 
-    if component["type"] in TOP_LEVEL_COMPONENTS:
+    if type(component).__name__ in TOP_LEVEL_COMPONENTS:
         text.append("\n")
 
-    return clean_html("".join(text))
+    return "".join(text)
 
 
 # whether a top-level markdown child is valid for parsing
 def component_is_valid(component):
-    return component["type"] in TOP_LEVEL_COMPONENTS
-
-
-def extract_component_info(component):
-    text = find_component_text(component)
-    tokens = tokenizer(text)["input_ids"]
-
-    return {
-        "text": text,
-        "tokens": len(tokens),
-    }
+    return type(component).__name__ in TOP_LEVEL_COMPONENTS
 
 
 def md_parser(chapter):
-    # extract text and token count from parsed markdown
-    parsed = json.loads(mistletoe.markdown(chapter, ASTRenderer))
-    valid_children = filter(component_is_valid, parsed["children"])
-    children_info = map(extract_component_info, valid_children)
+    # parse with the same span tokens as the AST renderer, walking the tokens directly
+    with ASTRenderer():
+        document = Document(chapter)
+
+    # extract text and token count from parsed markdown, stripping html once per component
+    valid_children = filter(component_is_valid, document.children)
+    children_info = tokenize_components([clean_html(find_component_text(child)) for child in valid_children])
     non_empty_components = list(filter(lambda c: c["tokens"] > 0, children_info))
 
     return non_empty_components
@@ -1,21 +1,54 @@
-from transformers import GPT2Tokenizer
+from itertools import islice
+from .tokens import tokenize_components
+from ..consts import TEXT_COMPONENT_TOKENS
 
-tokenizer = GPT2Tokenizer.from_pretrained("gpt2")
+# most characters read at once, splitting longer lines so memory stays bounded
+MAX_READ_CHARS = 16 * 1024
 
-def extract_chunk_info(chunk):
-    tokens = tokenizer(chunk)["input_ids"]
+# paragraphs tokenized in each batch
+TOKENIZE_BATCH_SIZE = 64
 
-    return {
-        "text": chunk,
-        "tokens": len(tokens),
-    }
 
+# read paragraphs ending in blank lines, without reading the whole file into memory
+def read_paragraphs(content):
+    paragraph = []
+    size = 0
 
-def parse_text(content):
-    content = content.read()
+    for line in iter(lambda: content.readline(MAX_READ_CHARS), ""):
+        paragraph.append(line)
+        size += len(line)
+
+        # end paragraphs at blank lines, or early if they grow too long
+        if not line.strip() or size >= MAX_READ_CHARS:
+            yield "".join(paragraph)
+            paragraph = []
+            size = 0
+
+    if paragraph:
+        yield "".join(paragraph)
+
+
+# tokenize paragraphs in batches, joining consecutive paragraphs up to `target` tokens
+def coalesce_paragraphs(paragraphs, target):
+    text = []
+    tokens = 0
 
-    # chunk text by newlines
-    delimiter = "\n"
-    chunks = [chunk + delimiter for chunk in content.split(delimiter)]
+    while batch := list(islice(paragraphs, TOKENIZE_BATCH_SIZE)):
+        for paragraph in tokenize_components(batch):
+            if text and tokens + paragraph["tokens"] > target:
+                yield { "text": "".join(text), "tokens": tokens }
+                text = []
+                tokens = 0
+
+            text.append(paragraph["text"])
+            tokens += paragraph["tokens"]
+
+    if text:
+        yield { "text": "".join(text), "tokens": tokens }
+
+
+def parse_text(content):
+    # chunk text by paragraphs, streaming from the uploaded file
+    components = coalesce_paragraphs(read_paragraphs(content), TEXT_COMPONENT_TOKENS)
 
-    return list(map(extract_chunk_info, chunks))
+    return [component for component in components if component["tokens"] > 0]
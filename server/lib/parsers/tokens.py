@@ -0,0 +1,110 @@
+import logging
+import os
+import threading
+import time
+from typing import List
+
+# prefer the Rust-backed tokenizer, which doesn't require importing `transformers`
+try:
+    from tokenizers import ByteLevelBPETokenizer
+except ImportError:
+    ByteLevelBPETokenizer = None
+
+# GPT-2 vocabulary vendored from https://github.com/openai/gpt-2 (MIT license)
+# so the tokenizer loads offline, without Hugging Face hub lookups
+VOCAB_DIR = os.path.join(os.path.dirname(os.path.realpath(__file__)), "gpt2")
+VOCAB_FILE = os.path.join(VOCAB_DIR, "vocab.json")
+MERGES_FILE = os.path.join(VOCAB_DIR, "merges.txt")
+
+logger = logging.getLogger(__name__)
+
+# tokenizer shared by all parsers, loaded on first use
+_tokenizer = None
+_tokenizer_lock = threading.Lock()
+
+# load-time metrics reported by `tokenizer_metrics`
+_metrics = {
+    "loaded": False,
+    "backend": None,
+    "load_seconds": None,
+    "loaded_by_pid": None,
+}
+
+
+class TransformersTokenizer:
+    """
+    Fallback when `tokenizers` isn't installed, using the pure-Python GPT-2
+    tokenizer from `transformers`.
+    """
+
+    def __init__(self):
+        from transformers import GPT2Tokenizer
+        self.tokenizer = GPT2Tokenizer.from_pretrained(VOCAB_DIR, local_files_only=True)
+
+    def count(self, texts: List[str]) -> List[int]:
+        return [len(ids) for ids in self.tokenizer(texts)["input_ids"]]
+
+
+class RustTokenizer:
+    def __init__(self):
+        self.tokenizer = ByteLevelBPETokenizer(VOCAB_FILE, MERGES_FILE)
+
+    def count(self, texts: List[str]) -> List[int]:
+        return [len(encoding.ids) for encoding in self.tokenizer.encode_batch(texts)]
+
+
+def load_tokenizer():
+    """
+    Loads the shared tokenizer if it hasn't been loaded yet.
+
+    Called from the gunicorn master before workers fork, so that workers share
+    the loaded vocabulary copy-on-write instead of each loading their own.
+    """
+
+    global _tokenizer
+
+    if _tokenizer is not None:
+        return _tokenizer
+
+    with _tokenizer_lock:
+        if _tokenizer is None:
+            start = time.perf_counter()
+            tokenizer = RustTokenizer() if ByteLevelBPETokenizer else TransformersTokenizer()
+
+            _metrics.update({
+                "loaded": True,
+                "backend": type(tokenizer).__name__,
+                "load_seconds": round(time.perf_counter() - start, 4),
+                "loaded_by_pid": os.getpid(),
+            })
+            logger.info(f"Loaded tokenizer: {_metrics}")
+
+            _tokenizer = tokenizer
+
+    return _tokenizer
+
+
+def tokenizer_metrics():
+    return { **_metrics, "pid": os.getpid() }
+
+
+def count_tokens(texts: List[str]) -> List[int]:
+    """
+    Counts the tokens in each text, tokenizing all texts in a single batch.
+    """
+
+    if not texts:
+        return []
+
+    return load_tokenizer().count(texts)
+
+
+def tokenize_components(texts: List[str]):
+    """
+    Builds parsed components with the text and token count of each text.
+    """
+
+    return [
+        { "text": text, "tokens": tokens }
+        for text, tokens in zip(texts, count_tokens(texts))
+    ]
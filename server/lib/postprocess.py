@@ -1,36 +1,202 @@
 import json
 import openai
 import os
+import re
 from dotenv import load_dotenv
-from .consts import NUM_QUESTIONS, FeedbackTypes
+from .consts import EDIT_MODE_FALLBACK, NUM_QUESTIONS, FeedbackTypes
+from .parsers.tokens import count_tokens
+from .throttle import openai_throttle
 
 # set up openai
 load_dotenv()
 openai.api_key = os.getenv("OPENAI_SECRET_KEY")
 
+# optionally use another OpenAI-compatible API, eg. experiments/server-tests/fake_openai.py
+openai.api_base = os.getenv("OPENAI_API_BASE", openai.api_base)
+
 
 EDIT_MODE_INSTRUCTION = 'Convert the list of questions into an array of JSON objects parseable by Python. Do not assign the JSON to a variable. Each object should contain keys for "question", "correct", and "incorrect".'
 
-def postprocess_edit_mode(output: str, num_questions=NUM_QUESTIONS):
-    edited = openai.Edit.create(
-        model="code-davinci-edit-001",
-        input=output,
-        instruction=EDIT_MODE_INSTRUCTION,
-        n=1,
-        temperature=0,
-    )["choices"][0]["text"]
+# whether a question decoded from JSON has a question, correct answer, and distractors
+def is_well_formed(question):
+    if not isinstance(question, dict):
+        return False
+
+    incorrect = question.get("incorrect")
+
+    return isinstance(question.get("question"), str) and question["question"] != "" \
+        and isinstance(question.get("correct"), str) and question["correct"] != "" \
+        and isinstance(incorrect, list) and len(incorrect) > 0 \
+        and all(isinstance(answer, str) for answer in incorrect)
+
+
+def postprocess_edit_mode(output: str):
+    # edited JSON is roughly twice as long as its input
+    input_tokens = count_tokens([output + EDIT_MODE_INSTRUCTION])[0]
+    with openai_throttle.acquire(3 * input_tokens):
+        edited = openai.Edit.create(
+            model="code-davinci-edit-001",
+            input=output,
+            instruction=EDIT_MODE_INSTRUCTION,
+            n=1,
+            temperature=0,
+        )["choices"][0]["text"]
 
     # decode generated JSON
     try:
         parsed = json.loads(edited)
     except json.JSONDecodeError:
-        return False
+        return []
 
-    # ensure gpt-3 generated correct number of questions questions
-    if type(parsed) is not list or len(parsed) != num_questions:
-        return False
+    if type(parsed) is not list:
+        return []
+
+    return list(filter(is_well_formed, parsed))
+
+
+# labels used by `Prompt.add_template`, tolerating numbering, case, and spacing
+QUESTION_LABEL = re.compile(r"^\s*(?:\d+[.)]\s*)?question(?:\s*\d+)?\s*[:.]\s*", re.IGNORECASE)
+CORRECT_LABEL = re.compile(r"^\s*(?:[-*]\s*)?correct\s+answer\s*[:.]\s*", re.IGNORECASE)
+INCORRECT_LABEL = re.compile(r"^\s*(?:[-*]\s*)?(?:incorrect|wrong)\s+answer\s*[:.]\s*", re.IGNORECASE)
+
+# lettered options, eg. "A) ..." or "(b). ...", which answers may refer to by letter
+OPTION_LABEL = re.compile(r"^\s*\(?([A-Da-d])[).:]\s+")
+LETTER_REFERENCE = re.compile(r"^\(?([A-Da-d])\)?[.:]?$")
+
+
+def resolve_letter(answer: str, options: dict):
+    match = LETTER_REFERENCE.match(answer)
+
+    if match and match.group(1).upper() in options:
+        return options[match.group(1).upper()]
+
+    return answer
+
+
+def parse_template_question(lines):
+    question = []
+    correct = None
+    incorrect = []
+    options = {}
+
+    # field that unlabeled lines continue
+    current = question
+
+    for line in lines:
+        if CORRECT_LABEL.match(line):
+            correct = [CORRECT_LABEL.sub("", line)]
+            current = correct
+        elif INCORRECT_LABEL.match(line):
+            incorrect.append([INCORRECT_LABEL.sub("", line)])
+            current = incorrect[-1]
+        elif OPTION_LABEL.match(line) and correct is None:
+            letter = OPTION_LABEL.match(line).group(1).upper()
+            options[letter] = OPTION_LABEL.sub("", line).strip()
+            current = []
+        elif line.strip():
+            current.append(line)
+
+    question = "\n".join(question).strip()
+    if not question or correct is None:
+        return None
+
+    correct = resolve_letter("\n".join(correct).strip(), options)
+    incorrect = [resolve_letter("\n".join(answer).strip(), options) for answer in incorrect]
+
+    # questions listing lettered options may only label the correct answer
+    if not incorrect:
+        incorrect = [option for option in options.values() if option != correct]
+
+    incorrect = [answer for answer in incorrect if answer]
+    if not correct or not incorrect:
+        return None
+
+    return {
+        "question": question,
+        "correct": correct,
+        "incorrect": incorrect,
+    }
+
+
+# group lines by question, dropping text before the first question
+def template_blocks(output: str):
+    blocks = []
+    for line in output.splitlines():
+        if QUESTION_LABEL.match(line):
+            blocks.append([QUESTION_LABEL.sub("", line)])
+        elif blocks:
+            blocks[-1].append(line)
+
+    return blocks
+
+
+# text of a completion cut off by `max_tokens` before its last question, which may be incomplete
+def complete_questions(output: str):
+    lines = output.splitlines(keepends=True)
+    starts = [index for index, line in enumerate(lines) if QUESTION_LABEL.match(line)]
+
+    return "".join(lines[:starts[-1]]) if starts else ""
+
+
+def parse_template(output: str):
+    """
+    Parses every well-formed question following the "Question:/Correct answer:/
+    Incorrect answer:" template locally, without a round trip to the OpenAI API.
+    """
+
+    return [question for question in map(parse_template_question, template_blocks(output)) if question]
+
+
+class TemplateStream:
+    """
+    Incrementally parses streamed template text, returning well-formed
+    questions as soon as each question is complete, ie. once the following
+    question has started.
+    """
+
+    def __init__(self):
+        self.output = ""
+        self.parsed_blocks = 0
+
+    def parse_blocks(self, blocks):
+        return [question for question in map(parse_template_question, blocks) if question]
+
+    def feed(self, chunk: str):
+        self.output += chunk
+        blocks = template_blocks(self.output)
+
+        questions = self.parse_blocks(blocks[self.parsed_blocks:-1])
+        self.parsed_blocks = max(self.parsed_blocks, len(blocks) - 1)
+
+        return questions
+
+    def close(self, truncated=False):
+        # last question is complete once the stream ends, unless it was cut off by `max_tokens`
+        blocks = template_blocks(self.output)
+        questions = self.parse_blocks(blocks[self.parsed_blocks:]) if not truncated else []
+        self.parsed_blocks = len(blocks)
+
+        return questions
+
+
+def postprocess_questions(output: str, num_questions=NUM_QUESTIONS, fallback=EDIT_MODE_FALLBACK, truncated=False):
+    """
+    Converts a completion into a list of at most `num_questions` well-formed
+    questions, using the Edit API only when nothing can be parsed locally.
+    The last question of a `truncated` completion is dropped.
+
+    Returns fewer questions than requested when only some are well-formed.
+    """
+
+    if truncated:
+        output = complete_questions(output)
+
+    parsed = parse_template(output)
+
+    if not parsed and fallback and output.strip():
+        parsed = postprocess_edit_mode(output)
 
-    return parsed
+    return parsed[:num_questions]
 
 
 def postprocess_manual(answers: str, shard: int):
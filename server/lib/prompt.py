@@ -1,5 +1,6 @@
 from __future__ import annotations
 from lib.consts import NUM_QUESTIONS
+from lib.parsers.tokens import count_tokens
 
 
 TEMPLATE = {
@@ -20,6 +21,10 @@ class Prompt:
         self.num_questions = num_questions
 
 
+    def token_count(self) -> int:
+        return count_tokens([self.prompt])[0]
+
+
     def join(self, other: Prompt) -> Prompt:
         return Prompt(self.prompt + other.prompt, self.num_questions)
 
@@ -0,0 +1,107 @@
+from dataclasses import dataclass, field
+import logging
+import random
+import time
+from typing import Callable, List, Optional
+import openai.error as OpenAIError
+from .consts import COMPLETION_DEADLINE, MAX_COMPLETION_ATTEMPTS, RETRY_BASE_DELAY, RETRY_MAX_DELAY
+from .errors import QuizicistError, error_message
+
+logger = logging.getLogger(__name__)
+
+# OpenAI errors which may succeed when retried
+TRANSIENT_ERRORS = (
+    OpenAIError.RateLimitError,
+    OpenAIError.ServiceUnavailableError,
+    OpenAIError.Timeout,
+    OpenAIError.APIConnectionError,
+    OpenAIError.TryAgain,
+)
+
+
+@dataclass
+class Attempt:
+    number: int
+
+    # "success", "malformed" (output couldn't be parsed), or "error"
+    outcome: str
+    seconds: float
+    error: Optional[str] = None
+
+
+@dataclass
+class RetryPolicy:
+    max_attempts: int = MAX_COMPLETION_ATTEMPTS
+
+    # seconds to wait before the first retry, doubled on each following retry
+    base_delay: float = RETRY_BASE_DELAY
+    max_delay: float = RETRY_MAX_DELAY
+
+    # seconds allowed for all attempts, including waits between them
+    deadline: float = COMPLETION_DEADLINE
+
+    def backoff(self, attempt: int) -> float:
+        # exponential backoff with full jitter, spreading out retries from concurrent requests
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** (attempt - 1)))
+
+
+@dataclass
+class RetryResult:
+    value: object
+    attempts: List[Attempt] = field(default_factory=list)
+
+
+def retry(run: Callable[[float], object], policy: RetryPolicy, description: str) -> RetryResult:
+    """
+    Calls `run` with the number of seconds remaining before the policy's
+    deadline until it returns a truthy value.
+
+    Raises a `QuizicistError` once the policy's attempts or deadline are
+    exhausted. Non-transient OpenAI errors are raised immediately.
+    """
+
+    start = time.monotonic()
+    attempts = []
+    last_error = None
+
+    for number in range(1, policy.max_attempts + 1):
+        remaining = policy.deadline - (time.monotonic() - start)
+        if remaining <= 0:
+            break
+
+        attempt_start = time.monotonic()
+        try:
+            value = run(remaining)
+            outcome = "success" if value else "malformed"
+            error = None
+        except TRANSIENT_ERRORS as e:
+            value = None
+            outcome = "error"
+            error = last_error = e
+
+        attempt = Attempt(
+            number=number,
+            outcome=outcome,
+            seconds=round(time.monotonic() - attempt_start, 3),
+            error=repr(error) if error else None,
+        )
+        attempts.append(attempt)
+        logger.info(f"{description}: {attempt}")
+
+        if value:
+            return RetryResult(value, attempts)
+
+        # wait before retrying, unless it would pass the deadline
+        if number < policy.max_attempts:
+            delay = policy.backoff(number)
+            if time.monotonic() - start + delay >= policy.deadline:
+                break
+
+            time.sleep(delay)
+
+    logger.warning(f"{description}: gave up after {len(attempts)} attempts")
+
+    if last_error and attempts[-1].outcome == "error":
+        raise QuizicistError(error_message(last_error)) from last_error
+
+    raise QuizicistError("We couldn't generate well-formatted questions for your content. Please try again.")
@@ -0,0 +1,35 @@
+from dataclasses import fields, is_dataclass
+import json
+
+# prefer orjson, which encodes several times faster than the standard library
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def to_dict(model) -> dict:
+    """
+    Converts a model to a dict of its annotated fields, like
+    `dataclasses.asdict` without deep-copying every value.
+    """
+
+    return { field.name: to_value(getattr(model, field.name)) for field in fields(model) }
+
+
+def to_value(value):
+    if is_dataclass(value):
+        return to_dict(value)
+
+    if isinstance(value, list):
+        return [to_value(item) for item in value]
+
+    return value
+
+
+def dumps(data) -> str:
+    # keys are sorted like Flask's JSON responses
+    if orjson is not None:
+        return orjson.dumps(data, option=orjson.OPT_SORT_KEYS).decode()
+
+    return json.dumps(data, sort_keys=True, separators=(",", ":"))
@@ -0,0 +1,215 @@
+from contextlib import contextmanager
+import logging
+import os
+import random
+import threading
+import time
+import uuid
+from typing import Optional
+from urllib.parse import parse_qs, urlparse
+from pymemcache.client.base import Client
+from .consts import MAX_OPENAI_REQUESTS, OPENAI_SLOT_LEASE, OPENAI_THROTTLE_MAX_WAIT, OPENAI_TOKENS_PER_MINUTE
+from .errors import QuizicistError
+
+logger = logging.getLogger(__name__)
+
+# seconds between checks for free capacity, jittered so waiting requests don't retry in lockstep
+POLL_INTERVAL = 0.25
+
+# slot used when the backend can't be reached
+UNTHROTTLED = "unthrottled"
+
+
+def window_usage(current: int, previous: int, now: float) -> float:
+    """
+    Estimates tokens used in the last minute from the current and previous
+    minute's totals, weighting the previous minute by how much of it overlaps.
+    """
+
+    elapsed = (now % 60) / 60
+    return current + previous * (1 - elapsed)
+
+
+class MemoryThrottle:
+    """
+    Limits OpenAI requests from a single process, for local development.
+    """
+
+    def __init__(self, max_requests=MAX_OPENAI_REQUESTS, tokens_per_minute=OPENAI_TOKENS_PER_MINUTE):
+        self.max_requests = max_requests
+        self.tokens_per_minute = tokens_per_minute
+
+        self.slots = set()
+        self.tokens = {}
+        self.lock = threading.Lock()
+
+    def acquire_slot(self) -> Optional[str]:
+        with self.lock:
+            if len(self.slots) >= self.max_requests:
+                return None
+
+            slot = uuid.uuid4().hex
+            self.slots.add(slot)
+            return slot
+
+    def release_slot(self, slot: str):
+        with self.lock:
+            self.slots.discard(slot)
+
+    def reserve_tokens(self, tokens: int) -> bool:
+        now = time.time()
+        minute = int(now // 60)
+
+        with self.lock:
+            used = window_usage(self.tokens.get(minute, 0), self.tokens.get(minute - 1, 0), now)
+
+            # requests larger than the budget are allowed once nothing else has been used
+            if used + tokens > self.tokens_per_minute and used > 0:
+                return False
+
+            self.tokens = { minute - 1: self.tokens.get(minute - 1, 0), minute: self.tokens.get(minute, 0) + tokens }
+            return True
+
+
+class MemcachedThrottle:
+    """
+    Limits OpenAI requests across every process using the memcached instance.
+
+    Request slots are separate keys claimed with `add`, which expire after
+    `OPENAI_SLOT_LEASE` seconds so slots held by crashed workers are freed.
+    Tokens are counted per minute and limited with a sliding window.
+    """
+
+    def __init__(self, host: str, port: int, max_requests=MAX_OPENAI_REQUESTS, tokens_per_minute=OPENAI_TOKENS_PER_MINUTE):
+        self.client = Client((host, port))
+        self.max_requests = max_requests
+        self.tokens_per_minute = tokens_per_minute
+
+    def slot_key(self, index: int):
+        return f"quizicist:openai:slot:{index}"
+
+    def tokens_key(self, minute: int):
+        return f"quizicist:openai:tokens:{minute}"
+
+    def acquire_slot(self) -> Optional[str]:
+        # start at a random slot so waiting requests don't all contend for the first one
+        offset = random.randrange(self.max_requests)
+
+        for index in range(self.max_requests):
+            key = self.slot_key((offset + index) % self.max_requests)
+
+            if self.client.add(key, b"1", expire=OPENAI_SLOT_LEASE, noreply=False):
+                return key
+
+        return None
+
+    def release_slot(self, slot: str):
+        self.client.delete(slot)
+
+    def reserve_tokens(self, tokens: int) -> bool:
+        now = time.time()
+        minute = int(now // 60)
+        key = self.tokens_key(minute)
+
+        self.client.add(key, b"0", expire=120, noreply=False)
+        current = self.client.incr(key, tokens) or tokens
+        previous = int(self.client.get(self.tokens_key(minute - 1)) or 0)
+
+        used = window_usage(current - tokens, previous, now)
+
+        # requests larger than the budget are allowed once nothing else has been used
+        if used + tokens > self.tokens_per_minute and used > 0:
+            self.client.decr(key, tokens)
+            return False
+
+        return True
+
+
+def create_throttle(uri: str):
+    """
+    Creates a throttle backend from a URI, eg. `memory://?max_requests=4` or
+    `memcached://localhost:11211?tokens_per_minute=90000`.
+    """
+
+    parsed = urlparse(uri)
+    options = { key: int(values[-1]) for key, values in parse_qs(parsed.query).items() }
+
+    if parsed.scheme == "memory":
+        return MemoryThrottle(**options)
+
+    if parsed.scheme == "memcached":
+        return MemcachedThrottle(parsed.hostname or "localhost", parsed.port or 11211, **options)
+
+    raise ValueError(f"Unsupported OpenAI throttle URI: {uri}")
+
+
+class OpenAIThrottle:
+    """
+    Caps concurrent OpenAI requests and tokens requested per minute, shared
+    by every worker using the configured backend (`OPENAI_THROTTLE_URI`).
+    Requests wait for capacity instead of being sent and rate limited.
+    """
+
+    def __init__(self):
+        self.backend = create_throttle(os.getenv("OPENAI_THROTTLE_URI", "memory://"))
+
+    def init_app(self, app):
+        if "OPENAI_THROTTLE_URI" in app.config:
+            self.backend = create_throttle(app.config["OPENAI_THROTTLE_URI"])
+
+    # an unavailable backend shouldn't prevent completions, so its errors are only logged
+    def try_acquire(self, acquire):
+        try:
+            return acquire()
+        except Exception:
+            logger.exception("Failed to check OpenAI throttle")
+            return UNTHROTTLED
+
+    def release(self, slot):
+        try:
+            if slot is not UNTHROTTLED:
+                self.backend.release_slot(slot)
+        except Exception:
+            logger.exception("Failed to release OpenAI request slot")
+
+    def wait(self, acquire, deadline: float, description: str):
+        while True:
+            acquired = self.try_acquire(acquire)
+            if acquired:
+                return acquired
+
+            if time.monotonic() >= deadline:
+                logger.warning(f"Gave up waiting for OpenAI {description}")
+                raise QuizicistError("Quizicist is handling too many requests right now. Please try again in a few minutes.")
+
+            time.sleep(POLL_INTERVAL * random.uniform(0.5, 1.5))
+
+    @contextmanager
+    def acquire(self, tokens: int, timeout: float = OPENAI_THROTTLE_MAX_WAIT):
+        """
+        Waits up to `timeout` seconds for a request slot and `tokens` tokens of
+        the per-minute budget, yielding the seconds remaining of `timeout`.
+        """
+
+        start = time.monotonic()
+        deadline = start + min(timeout, OPENAI_THROTTLE_MAX_WAIT)
+
+        slot = self.wait(self.backend.acquire_slot, deadline, "request slot")
+        try:
+            self.wait(lambda: self.backend.reserve_tokens(tokens), deadline, "tokens")
+
+            waited = time.monotonic() - start
+            if waited > 1:
+                logger.info(f"Waited {waited:.1f}s for OpenAI capacity")
+
+            yield timeout - waited
+        finally:
+            self.release(slot)
+
+
+# upper bound on tokens used by a request, counting the prompt and every generated choice
+def request_tokens(prompt_tokens: int, max_tokens: int, n=1):
+    return prompt_tokens + max_tokens * n
+
+
+openai_throttle = OpenAIThrottle()
@@ -6,9 +6,15 @@ from blueprints.api import api
 from blueprints.auth import auth, login_manager
 from blueprints.admin import admin, bcrypt
 from dotenv import load_dotenv
+import click
 from db import db, migrate
 from config import APP_FOLDER
 from limiter import limiter
+from jobqueue import job_queue
+from lib.cache import completion_cache, generation_cache
+from lib.throttle import openai_throttle
+from lib.executor import completion_executor
+from models import Generation
 
 app = Flask(__name__)
 
@@ -17,6 +23,9 @@ load_dotenv()
 CONFIG_CLASS = "ProductionConfig" if os.getenv("ENV") == "prod" else "DebugConfig"
 app.config.from_object(f"config.{CONFIG_CLASS}")
 
+# override config with QUIZICIST_* environment variables, eg. for benchmarks
+app.config.from_prefixed_env("QUIZICIST")
+
 # initialize sqlite db with migrations
 db.init_app(app)
 migrate.init_app(app, db)
@@ -24,6 +33,21 @@ migrate.init_app(app, db)
 # limit requests by IP
 limiter.init_app(app)
 
+# queue question generation for background workers
+job_queue.init_app(app)
+
+# reuse completions for identical prompts
+completion_cache.init_app(app)
+
+# reuse serialized generations until they change
+generation_cache.init_app(app)
+
+# cap concurrent OpenAI requests and tokens per minute across workers
+openai_throttle.init_app(app)
+
+# fan out completions on greenlets or shared threads
+completion_executor.init_app(app)
+
 # initialize flask-login authentication
 login_manager.init_app(app)
 
@@ -42,3 +66,21 @@ app.register_blueprint(admin, url_prefix="/admin")
 def setup():
     # create directory for file uploads
     Path(os.path.join(APP_FOLDER, "uploads")).mkdir(exist_ok=True)
+
+# parse content of generations uploaded before shards were shared by content, run once after migrating
+@app.cli.command("backfill-shards")
+def backfill_shards():
+    generations = Generation.query.with_deleted().filter(
+        db.or_(Generation.content_hash.is_(None), ~Generation.shards.any())
+    ).all()
+
+    parsed = 0
+    for generation in generations:
+        try:
+            generation.create_shards()
+            parsed += 1
+        except FileNotFoundError:
+            db.session.rollback()
+            click.echo(f"Skipped generation {generation.id}, its upload is missing")
+
+    click.echo(f"Parsed content of {parsed} generations")
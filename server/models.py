@@ -6,13 +6,20 @@ from flask import current_app
 from flask_login import UserMixin
 from flask_sqlalchemy.query import Query
 from Levenshtein import distance
-from lib.completion import complete, add_answer_choices, chapter_tokens
-from lib.consts import ExportTypes, FeedbackTypes, MessageTypes
+from lib.completion import plan_completion, run_jobs, add_answer_choices, shard_chapter
+from lib.consts import ExportTypes, FeedbackTypes, JobStatus, JobTypes, MessageTypes
+from lib.errors import QuizicistError, error_message
+from lib.files import open_content, store_content
 from lib.parsers.md import md_parser
 from lib.parsers.text import parse_text
+from lib.serialize import dumps, to_dict
+import openai.error as OpenAIError
 import os
+from sqlalchemy import event
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.ext.hybrid import hybrid_property, hybrid_method
 from sqlalchemy.ext.orderinglist import OrderingList
+from sqlalchemy.orm import Session, selectinload
 from werkzeug.exceptions import Unauthorized
 import types
 
@@ -26,6 +33,14 @@ PARSERS = {
     "Plain Text": parse_text,
 }
 
+
+# `(text, predicted feedback)` for the answer choices of a generated question, correct answer first
+def answer_choices(question):
+    return [(question["correct"], FeedbackTypes.correct)] + [
+        (incorrect, FeedbackTypes.incorrect) for incorrect in question["incorrect"]
+    ]
+
+
 # `dataclasses.todict` tries to initialize lists with a generator
 # which fails because the `OrderingList` constructor takes a `str`
 # we override the `OrderingList` implementation to enable serialization
@@ -101,8 +116,33 @@ class Export(db.Model):
     google_form_id: str = db.Column(db.String(200), nullable=True)
 
 
+# section of uploaded content used as context for completions,
+# shared by generations with identical content
+@dataclass
+class Shard(db.Model):
+    __table_args__ = (db.UniqueConstraint("content_hash", "content_type", "position"),)
+
+    id: int = db.Column(db.Integer, primary_key=True)
+
+    # hash and format of content the shard was parsed from
+    content_hash: str = db.Column(db.String(64), nullable=False)
+    content_type: str = db.Column(db.String(10), nullable=False)
+
+    # order of shard within uploaded content
+    position: int = db.Column(db.Integer)
+
+    # parsed text of shard
+    text: str = db.Column(db.Text)
+
+    # number of tokens in text
+    tokens: int = db.Column(db.Integer)
+
+
 @dataclass
 class Generation(db.Model, UpdateMixin):
+    # covers listing a user's quizzes, newest first
+    __table_args__ = (db.Index("ix_generation_user_id_deleted_id", "user_id", "deleted", "id"),)
+
     id: int = db.Column(db.Integer, primary_key=True)
     user_id: int = db.Column(db.Integer, db.ForeignKey("user.id"))
     created_at = db.Column(db.DateTime, server_default=db.func.now())
@@ -111,26 +151,54 @@ class Generation(db.Model, UpdateMixin):
     deleted: bool = db.Column(db.Boolean(), default=False, nullable=False)
 
     filename: str = db.Column(db.String(FILENAME_LENGTH))
-    unique_filename: str = db.Column(db.String(FILENAME_LENGTH))
+
+    # file of content uploaded before uploads were stored by hash
+    unique_filename: str = db.Column(db.String(FILENAME_LENGTH), nullable=True)
+
+    # SHA-256 hash of uploaded content, see `lib.files.store_content`
+    content_hash: str = db.Column(db.String(64), index=True, nullable=True)
+
     questions: List[Question] = db.relationship(
         "Question",
         order_by="Question.position",
         collection_class=create_ordering_list("position"),
     )
 
+    # questions that haven't been deleted, filtered in SQL, not serialized
+    undeleted_questions = db.relationship(
+        "Question",
+        primaryjoin="and_(Generation.id == Question.generation_id, Question.deleted == false())",
+        order_by="Question.position",
+        viewonly=True,
+    )
+
     exports: List[Export] = db.relationship(Export, backref="generation")
 
+    # parsed shards of uploaded content, not serialized
+    shards = db.relationship(
+        Shard,
+        primaryjoin="and_(Generation.content_hash == foreign(Shard.content_hash), "
+                    "Generation.content_type == foreign(Shard.content_type))",
+        order_by=Shard.position,
+        viewonly=True,
+    )
+
     # format of uploaded content
     content_type: str = db.Column(db.String(10), default="Markdown", nullable=False)
 
+    # allow content longer than `MAX_SHARDS` shards, eg. whole chapters or books
+    long_document: bool = db.Column(db.Boolean, default=False, server_default=db.false(), nullable=False)
+
+    # incremented whenever the generation, its questions, answer choices, or exports change
+    revision: int = db.Column(db.Integer, default=0, server_default="0", nullable=False)
+
+    # when the revision was last incremented
+    updated_at = db.Column(db.DateTime, nullable=True)
+
     @hybrid_property
     def upload_path(cls):
         return os.path.join(current_app.config["UPLOAD_FOLDER"], cls.unique_filename)
 
-    @hybrid_property
-    def undeleted_questions(self):
-        return [question for question in self.questions if not question.deleted]
-
     # check if quiz has been interacted with
     @hybrid_property
     def interacted_with(self):
@@ -164,14 +232,15 @@ class Generation(db.Model, UpdateMixin):
         first_export: Export = self.exports[0]
         return (first_export.created_at - self.created_at).total_seconds() / 60.0
 
+    # shards of uploaded content, generations uploaded before shards were shared by content
+    # are parsed once with `flask backfill-shards`
     @hybrid_property
-    def content_tokens(self):
-        parser = PARSERS[self.content_type]
+    def content_shards(self):
+        return self.shards
 
-        with open(self.upload_path) as upload:
-            parsed = parser(upload)
-
-        return chapter_tokens(parsed)
+    @hybrid_property
+    def content_tokens(self):
+        return sum(shard.tokens for shard in self.content_shards)
 
     @hybrid_property
     def num_questions(self):
@@ -211,50 +280,152 @@ class Generation(db.Model, UpdateMixin):
 
         return feedback[0] * 100 / total
 
-    # TODO: remove need for parser
+    # parse and shard uploaded content once, storing shards for completions
     @hybrid_method
-    def add_questions(self, num_questions):
+    def create_shards(self):
+        # move content uploaded before uploads were stored by hash
+        if not self.content_hash:
+            with open(self.upload_path) as upload:
+                self.content_hash = store_content(upload.read())
+
+            db.session.commit()
+
+        # identical content has already been parsed
+        if self.shards:
+            return
+
         parser = PARSERS[self.content_type]
 
-        # run gpt-3 completion
-        with open(self.upload_path) as upload:
-            shards = complete(upload, parser, num_questions)
-
-        for shard, questions in enumerate(shards):
-            for question in questions:
-                q = Question(
-                    question=question["question"],
-                    original_question=question["question"],
-                    shard=shard,
-                )
-                self.questions.append(q)
-                db.session.commit()
-
-                # create correct answer choice
-                correct = AnswerChoice(
-                    text=question["correct"],
-                    original_text=question["correct"],
-                    predicted_feedback=FeedbackTypes.correct
-                )
-                q.answers.append(correct)
-
-                # create answer choices for incorrect choices
-                for incorrect in question["incorrect"]:
-                    distractor = AnswerChoice(
-                        text=incorrect,
-                        original_text=incorrect,
-                        predicted_feedback=FeedbackTypes.incorrect
-                    )
-                    q.answers.append(distractor)
-
-        # add distractors to db
+        with open_content(self.content_hash) as upload:
+            parsed = parser(upload)
+
+        db.session.add_all([
+            Shard(
+                content_hash=self.content_hash,
+                content_type=self.content_type,
+                position=position,
+                text=shard["text"],
+                tokens=shard["tokens"],
+            )
+            for position, shard in enumerate(shard_chapter(parsed))
+        ])
+
+        try:
+            db.session.commit()
+        except IntegrityError:
+            # identical content was parsed by a concurrent upload, use its shards instead
+            db.session.rollback()
+
+    @hybrid_method
+    def add_questions(self, num_questions, job: Job = None, use_cache=True):
+        # schedule gpt-3 completions
+        shards = [shard.text for shard in self.content_shards]
+        jobs = plan_completion(shards, num_questions, self.long_document)
+        pending = job.start(jobs) if job else list(range(len(jobs)))
+
+        # save each shard's questions and distractors in a single transaction as its completion finishes,
+        # so progress is visible while the job runs and finished shards are kept if a later one fails
+        for position, questions in run_jobs(shards, [jobs[index] for index in pending], use_cache=use_cache):
+            index = pending[position]
+            shard, _ = jobs[index]
+            self.insert_questions([(question, shard) for question in questions])
+
+            if job:
+                job.shards[index].status = JobStatus.complete
+
+            db.session.commit()
+
+    # bulk insert generated `(question, shard)` pairs with their answer choices, without committing
+    @hybrid_method
+    def insert_questions(self, generated):
+        if not generated:
+            return
+
+        # bump the revision first, locking the generation so concurrent jobs don't claim the same positions
+        db.session.execute(
+            db.update(Generation)
+                .where(Generation.id == self.id)
+                .values(revision=Generation.revision + 1, updated_at=db.func.now())
+                .execution_options(synchronize_session=False)
+        )
+        start = db.session.query(db.func.coalesce(db.func.max(Question.position) + 1, 0))\
+            .filter(Question.generation_id == self.id)\
+            .scalar()
+
+        db.session.execute(db.insert(Question), [
+            {
+                "generation_id": self.id,
+                "question": question["question"],
+                "original_question": question["question"],
+                "shard": shard,
+                "position": start + offset,
+            }
+            for offset, (question, shard) in enumerate(generated)
+        ])
+
+        # ids of inserted questions, by position
+        question_ids = dict(
+            db.session.query(Question.position, Question.id)
+                .filter(Question.generation_id == self.id, Question.position >= start)
+        )
+
+        db.session.execute(db.insert(AnswerChoice), [
+            {
+                "question_id": question_ids[start + offset],
+                "position": position,
+                "text": text,
+                "original_text": text,
+                "predicted_feedback": feedback,
+            }
+            for offset, (question, _) in enumerate(generated)
+            for position, (text, feedback) in enumerate(answer_choices(question))
+        ])
+
+        # questions were inserted outside of the ORM, so reload them when next accessed
+        db.session.expire(self, ["questions", "undeleted_questions", "revision", "updated_at"])
+
+    # serialize the generation without deleted questions and answer choices, unless `include_deleted`,
+    # loading them in a fixed number of queries
+    @hybrid_method
+    def to_json(self, include_deleted=False) -> str:
+        questions, answers = Generation.questions, Question.answers
+        if not include_deleted:
+            questions = questions.and_(Question.deleted == db.false())
+            answers = answers.and_(AnswerChoice.deleted == db.false())
+
+        generation = db.session.query(Generation)\
+            .options(
+                selectinload(questions).selectinload(answers),
+                selectinload(Generation.exports),
+            )\
+            .populate_existing()\
+            .filter(Generation.id == self.id)\
+            .one()
+
+        return dumps(to_dict(generation))
+
+    # add a generated `{"question", "correct", "incorrect"}` question
+    @hybrid_method
+    def add_question(self, question, shard: int) -> Question:
+        q = Question(
+            question=question["question"],
+            original_question=question["question"],
+            shard=shard,
+        )
+        self.questions.append(q)
         db.session.commit()
 
+        # create answer choices for correct and incorrect choices
+        for text, feedback in answer_choices(question):
+            q.answers.append(AnswerChoice(text=text, original_text=text, predicted_feedback=feedback))
+
+        return q
+
     @hybrid_method
     def add_answer_choices(self, question: Question):
-        with open(self.upload_path) as upload:
-            custom_output = add_answer_choices(upload, PARSERS[self.content_type], question)
-        
+        shard = self.content_shards[question.shard]
+        custom_output = add_answer_choices(shard.text, question)
+
         for option in custom_output["options"]:
             choice = AnswerChoice(
                 text=option["text"],
@@ -273,6 +444,7 @@ class Generation(db.Model, UpdateMixin):
 @dataclass
 class Question(db.Model, UpdateMixin):
     __tablename__ = "question"
+    __table_args__ = (db.Index("ix_question_generation_id_deleted_position", "generation_id", "deleted", "position"),)
 
     id: int = db.Column(db.Integer, primary_key=True)
     generation_id: int = db.Column(db.Integer, db.ForeignKey("generation.id"))
@@ -300,6 +472,14 @@ class Question(db.Model, UpdateMixin):
         collection_class=create_ordering_list("position"),
     )
 
+    # answer choices that haven't been deleted, filtered in SQL, not serialized
+    undeleted_answers = db.relationship(
+        "AnswerChoice",
+        primaryjoin="and_(Question.id == AnswerChoice.question_id, AnswerChoice.deleted == false())",
+        order_by="AnswerChoice.position",
+        viewonly=True,
+    )
+
     # shard of uploaded content used to generate question
     shard: int = db.Column(db.Integer, default=0)
 
@@ -307,10 +487,6 @@ class Question(db.Model, UpdateMixin):
     def generation(self):
         return db.session.query(Generation).get(self.generation_id)
 
-    @hybrid_property
-    def undeleted_answers(self):
-        return [answer for answer in self.answers if not answer.deleted]
-
     @hybrid_property
     def edited(self):
         # is deleted
@@ -346,6 +522,7 @@ class Question(db.Model, UpdateMixin):
 @dataclass
 class AnswerChoice(db.Model, UpdateMixin):
     __tablename__ = "answerchoice"
+    __table_args__ = (db.Index("ix_answerchoice_question_id_deleted_position", "question_id", "deleted", "position"),)
 
     id: int = db.Column(db.Integer, primary_key=True)
     question_id: int = db.Column(db.Integer, db.ForeignKey("question.id"))
@@ -391,6 +568,97 @@ class AnswerChoice(db.Model, UpdateMixin):
             raise Unauthorized("User doesn't have access to this answer choice")
 
 
+# progress of a single shard's completion within a job
+@dataclass
+class JobShard(db.Model):
+    __tablename__ = "jobshard"
+
+    id: int = db.Column(db.Integer, primary_key=True)
+    job_id: int = db.Column(db.Integer, db.ForeignKey("job.id"))
+
+    # index of content shard used to generate questions
+    shard: int = db.Column(db.Integer)
+
+    # number of questions requested from shard
+    num_questions: int = db.Column(db.Integer)
+
+    status: JobStatus = db.Column(db.Enum(JobStatus), default=JobStatus.queued, nullable=False)
+
+
+# question generation run by a background worker
+@dataclass
+class Job(db.Model):
+    id: int = db.Column(db.Integer, primary_key=True)
+    generation_id: int = db.Column(db.Integer, db.ForeignKey("generation.id"))
+    created_at = db.Column(db.DateTime, server_default=db.func.now())
+    started_at = db.Column(db.DateTime, nullable=True)
+    finished_at = db.Column(db.DateTime, nullable=True)
+
+    job_type: JobTypes = db.Column(db.Enum(JobTypes))
+    status: JobStatus = db.Column(db.Enum(JobStatus), default=JobStatus.queued, nullable=False)
+
+    # number of questions to generate
+    num_questions: int = db.Column(db.Integer)
+
+    # user-facing message if job failed
+    error: str = db.Column(db.String(ITEM_LENGTH), nullable=True)
+
+    # reuse cached completions for identical prompts
+    use_cache: bool = db.Column(db.Boolean, default=True, server_default=db.true(), nullable=False)
+
+    # when the job was last queued, or last reported alive by the worker running it, see `JobQueue.recover`
+    heartbeat_at = db.Column(db.DateTime, nullable=True)
+
+    # progress of each scheduled completion
+    shards: List[JobShard] = db.relationship(JobShard, order_by=JobShard.id)
+
+    generation = db.relationship(Generation)
+
+    # record scheduled `(shard, num_questions)` completions, returning the indices of those still to run
+    @hybrid_method
+    def start(self, jobs):
+        # keep completions saved by an earlier run of the job, eg. on a worker which crashed
+        if len(self.shards) != len(jobs):
+            self.shards = [JobShard(shard=shard, num_questions=num_questions) for shard, num_questions in jobs]
+
+        pending = [index for index, shard in enumerate(self.shards) if shard.status != JobStatus.complete]
+        for index in pending:
+            self.shards[index].status = JobStatus.running
+
+        db.session.commit()
+        return pending
+
+    @hybrid_method
+    def run(self):
+        try:
+            self.generation.add_questions(self.num_questions, job=self, use_cache=self.use_cache)
+            self.status = JobStatus.complete
+        except Exception as e:
+            db.session.rollback()
+
+            # unexpected errors are logged, expected errors are only reported to the user
+            if not isinstance(e, (QuizicistError, OpenAIError.OpenAIError)):
+                current_app.logger.exception(f"Job {self.id} failed")
+
+            self.status = JobStatus.failed
+            self.error = error_message(e)
+
+            for shard in self.shards:
+                if shard.status != JobStatus.complete:
+                    shard.status = JobStatus.failed
+
+            # don't leave an empty quiz on the dashboard when none of its questions could be generated
+            if self.job_type == JobTypes.upload and not self.generation.undeleted_questions:
+                self.generation.deleted = True
+
+        self.finished_at = db.func.now()
+        db.session.commit()
+
+    @hybrid_method
+    def check_ownership(self, user_id):
+        self.generation.check_ownership(user_id)
+
+
 # user-provided message about experience using quizicist
 class Message(db.Model):
     id: int = db.Column(db.Integer, primary_key=True)
@@ -407,3 +675,53 @@ class User(db.Model, UserMixin):
 
     generations: List[Generation] = db.relationship("Generation", backref="user", cascade="all, delete-orphan")
     messages: List[Message] = db.relationship("Message", backref="user", cascade="all, delete-orphan")
+
+
+# bump the revisions of generations changed by a flush, so their cached JSON isn't reused
+@event.listens_for(Session, "after_flush")
+def bump_generation_revisions(session, flush_context):
+    generation_ids = set()
+    question_ids = set()
+
+    for instance in [*session.new, *session.dirty, *session.deleted]:
+        if instance in session.dirty and not session.is_modified(instance):
+            continue
+
+        if isinstance(instance, Generation) and instance not in session.new:
+            generation_ids.add(instance.id)
+        elif isinstance(instance, (Question, Export)):
+            generation_ids.add(instance.generation_id)
+        elif isinstance(instance, AnswerChoice):
+            question_ids.add(instance.question_id)
+
+    generation_ids.discard(None)
+    question_ids.discard(None)
+
+    if not generation_ids and not question_ids:
+        return
+
+    changed = Generation.__table__.c.id.in_(generation_ids)
+    if question_ids:
+        questions = Question.__table__
+        changed |= Generation.__table__.c.id.in_(
+            db.select(questions.c.generation_id).where(questions.c.id.in_(question_ids))
+        )
+
+    # run on the flush's connection, since queries through the session would flush again
+    session.connection().execute(
+        Generation.__table__.update()
+            .where(changed)
+            .values(revision=Generation.__table__.c.revision + 1, updated_at=db.func.now())
+    )
+    session.info["revised_generations"] = True
+
+
+# reload revisions and update times of generations in the session when they're next accessed, after they were bumped
+@event.listens_for(Session, "after_flush_postexec")
+def expire_generation_revisions(session, flush_context):
+    if not session.info.pop("revised_generations", False):
+        return
+
+    for instance in session.identity_map.values():
+        if isinstance(instance, Generation):
+            session.expire(instance, ["revision", "updated_at"])
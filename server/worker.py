@@ -0,0 +1,43 @@
+import os
+
+# run completions on greenlets, patching blocking I/O before anything else is imported
+if os.getenv("COMPLETION_EXECUTOR") == "gevent":
+    from gevent import monkey
+    monkey.patch_all()
+
+import time
+from main import app
+from jobqueue import job_queue
+from lib.consts import JOB_RECOVER_INTERVAL
+
+# seconds to wait between checks for new jobs
+POLL_INTERVAL = 1
+
+
+# run queued question generation jobs until stopped
+def work():
+    with app.app_context():
+        job_queue.recover(requeue_all=True)
+
+    recovered_at = time.monotonic()
+
+    while True:
+        with app.app_context():
+            # queue jobs lost by crashed workers or by the queue backend
+            if time.monotonic() - recovered_at >= JOB_RECOVER_INTERVAL:
+                job_queue.recover()
+                recovered_at = time.monotonic()
+
+            job = job_queue.dequeue()
+
+            if job is None:
+                time.sleep(POLL_INTERVAL)
+                continue
+
+            app.logger.info(f"Running job {job.id} for generation {job.generation_id}")
+            with job_queue.heartbeat(app, job.id):
+                job.run()
+
+
+if __name__ == "__main__":
+    work()